@@ -10,6 +10,8 @@ logger = logging.getLogger(__name__)
 class ExecutedProvider(Provider):
     """Guarantees availability of executor and provides common helper methods."""
 
+    __slots__ = ()
+
     @abstractmethod
     def setup(self) -> Executor:
         """Launch environment, returning build instance executor."""
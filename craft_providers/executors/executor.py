@@ -3,12 +3,32 @@ import pathlib
 import shutil
 import subprocess
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
 
 from ..util import path
 
 logger = logging.getLogger(__name__)
 
+# Use 512 KiB tar records (rather than the default 10 KiB) to reduce the
+# number of reads and writes needed to move archives through pipes.
+_TAR_BLOCKING_FACTOR = "1024"
+
+
+def _wait_for_pipe(
+    *, archive_proc: subprocess.Popen, target_proc: subprocess.Popen
+) -> None:
+    """Wait for both ends of tar pipe to complete.
+
+    :raises subprocess.CalledProcessError: if either end failed.
+    """
+    target_proc.wait()
+    archive_proc.wait()
+
+    # Check target first, if it failed the archive likely exited with SIGPIPE.
+    for proc in [target_proc, archive_proc]:
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
 
 class Executor(ABC):
     """Interfaces to execute commands and move data in/out of an environment."""
@@ -80,12 +100,25 @@ class Executor(ABC):
         """
         ...
 
+    def resolve_mounted_path(self, host_path: pathlib.Path) -> Optional[pathlib.Path]:
+        """Get the path at which host path is mounted in the environment.
+
+        Allows syncs to be skipped when the data is already shared.
+
+        :returns: Path in environment, or None if host path is not mounted.
+        """
+        return None
+
     def is_target_directory(self, target: pathlib.Path) -> bool:
-        proc = self.execute_run(command=["test", "-d", target.as_posix()])
+        proc = self.execute_run(
+            command=["test", "-d", target.as_posix()], stdout=subprocess.DEVNULL
+        )
         return proc.returncode == 0
 
     def is_target_file(self, target: pathlib.Path) -> bool:
-        proc = self.execute_run(command=["test", "-f", target.as_posix()])
+        proc = self.execute_run(
+            command=["test", "-f", target.as_posix()], stdout=subprocess.DEVNULL
+        )
         return proc.returncode == 0
 
     def naive_directory_sync_from(
@@ -103,12 +136,29 @@ class Executor(ABC):
         destination.mkdir(parents=True)
 
         archive_proc = self.execute_popen(
-            ["tar", "cpf", "-", "-C", source.as_posix(), "."],
+            [
+                "tar",
+                "cpf",
+                "-",
+                "-b",
+                _TAR_BLOCKING_FACTOR,
+                "-C",
+                source.as_posix(),
+                ".",
+            ],
             stdout=subprocess.PIPE,
         )
 
         target_proc = subprocess.Popen(
-            [str(self.tar_path), "xpvf", "-", "-C", destination_path],
+            [
+                str(self.tar_path),
+                "xpf",
+                "-",
+                "-b",
+                _TAR_BLOCKING_FACTOR,
+                "-C",
+                destination_path,
+            ],
             stdin=archive_proc.stdout,
         )
 
@@ -116,8 +166,7 @@ class Executor(ABC):
         if archive_proc.stdout:
             archive_proc.stdout.close()
 
-        # Waot until done.
-        target_proc.communicate()
+        _wait_for_pipe(archive_proc=archive_proc, target_proc=target_proc)
 
     def naive_directory_sync_to(
         self, *, source: pathlib.Path, destination: pathlib.Path, delete=True
@@ -126,17 +175,30 @@ class Executor(ABC):
         destination_path = destination.as_posix()
 
         if delete is True:
-            self.execute_run(["rm", "-rf", destination_path], check=True)
+            self.execute_run(
+                ["rm", "-rf", destination_path], check=True, stdout=subprocess.DEVNULL
+            )
 
-        self.execute_run(["mkdir", "-p", destination_path], check=True)
+        self.execute_run(
+            ["mkdir", "-p", destination_path], check=True, stdout=subprocess.DEVNULL
+        )
 
         archive_proc = subprocess.Popen(
-            [self.tar_path, "cpf", "-", "-C", str(source), "."],
+            [
+                self.tar_path,
+                "cpf",
+                "-",
+                "-b",
+                _TAR_BLOCKING_FACTOR,
+                "-C",
+                str(source),
+                ".",
+            ],
             stdout=subprocess.PIPE,
         )
 
         target_proc = self.execute_popen(
-            ["tar", "xpvf", "-", "-C", destination_path],
+            ["tar", "xpf", "-", "-b", _TAR_BLOCKING_FACTOR, "-C", destination_path],
             stdin=archive_proc.stdout,
         )
 
@@ -144,5 +206,4 @@ class Executor(ABC):
         if archive_proc.stdout:
             archive_proc.stdout.close()
 
-        # Waot until done.
-        target_proc.communicate()
+        _wait_for_pipe(archive_proc=archive_proc, target_proc=target_proc)
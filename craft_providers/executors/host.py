@@ -1,44 +1,106 @@
+import fcntl
 import logging
+import os
 import pathlib
 import shlex
 import shutil
 import subprocess
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from .executor import Executor
 
 logger = logging.getLogger(__name__)
 
+# ioctl from linux/fs.h to share a file's extents with another (reflink).
+_FICLONE = 0x40049409
+
+
+def _copy_file(source: str, destination: str) -> str:
+    """Copy file and metadata as shutil.copy2() does, reflinking if possible.
+
+    On copy-on-write filesystems (e.g. btrfs, xfs) data is cloned rather than
+    copied, otherwise falls back to copying.
+    """
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+    except OSError:
+        # Unsupported by filesystem, or source and destination differ.
+        shutil.copyfile(source, destination)
+
+    shutil.copystat(source, destination)
+    return destination
+
 
 class HostExecutor(Executor):
     """Run commands directly on host."""
 
     def __init__(self, *, sudo: bool = True, sudo_user: str = "root") -> None:
+        super().__init__()
+
         self.sudo = sudo
         self.sudo_user = sudo_user
 
+        if sudo:
+            self._sudo_prefix = ["sudo", "-H", "-u", sudo_user]
+        else:
+            self._sudo_prefix = []
+
     def _prepare_execute_args(
         self, command: List[str], kwargs: Dict[str, Any]
     ) -> List[str]:
         """Formulate command, accounting for possible env & cwd."""
         env = kwargs.pop("env", dict())
 
-        final_cmd = ["env", "-"]
-        final_cmd += [f"{k}={v}" for k, v in env.items()]
+        # Run with only the specified environment, as `env -` would, without
+        # the cost of executing env.
+        kwargs["env"] = dict(env)
 
-        if self.sudo:
-            final_cmd += ["sudo", "-H", "-u", self.sudo_user]
-
-        final_cmd += command
+        final_cmd = self._sudo_prefix + command
 
-        quoted = " ".join([shlex.quote(c) for c in final_cmd])
-        logger.info(f"Executing: {quoted}")
+        # Skip quoting the command if it won't be logged.
+        if logger.isEnabledFor(logging.INFO):
+            env_args = [f"{k}={v}" for k, v in env.items()]
+            quoted = shlex.join(["env", "-", *env_args, *final_cmd])
+            logger.info(f"Executing: {quoted}")
 
         return final_cmd
 
     def clean(self) -> None:
         pass
 
+    def create_file(
+        self,
+        *,
+        destination: pathlib.Path,
+        content: bytes,
+        file_mode: str,
+        gid: Optional[int] = None,
+        uid: Optional[int] = None,
+    ) -> None:
+        """Create file with content and file mode.
+
+        Content is streamed to install(1) via stdin, setting mode and
+        ownership in a single command (run with sudo, if configured).
+        Ownership defaults to root with sudo, otherwise it is only set if
+        gid or uid is specified.
+        """
+        if self.sudo:
+            gid = 0 if gid is None else gid
+            uid = 0 if uid is None else uid
+
+        command = ["install", "-D", "-m", file_mode]
+        if uid is not None:
+            command += ["-o", str(uid)]
+        if gid is not None:
+            command += ["-g", str(gid)]
+        command += ["/dev/stdin", destination.as_posix()]
+
+        self.execute_run(command, input=content, check=True)
+
     def execute_run(self, command: List[str], **kwargs) -> subprocess.CompletedProcess:
         command = self._prepare_execute_args(command=command, kwargs=kwargs)
         return subprocess.run(command, **kwargs)
@@ -47,22 +109,50 @@ class HostExecutor(Executor):
         command = self._prepare_execute_args(command=command, kwargs=kwargs)
         return subprocess.Popen(command, **kwargs)
 
+    def is_target_directory(self, target: pathlib.Path) -> bool:
+        # Target may only be accessible to the sudo user.
+        if self.sudo:
+            return super().is_target_directory(target)
+
+        return target.is_dir()
+
+    def is_target_file(self, target: pathlib.Path) -> bool:
+        # Target may only be accessible to the sudo user.
+        if self.sudo:
+            return super().is_target_file(target)
+
+        return target.is_file()
+
     def mount(self, *, source: pathlib.Path, destination: pathlib.Path) -> bool:
         return False
 
+    def _is_same_path(self, source: pathlib.Path, destination: pathlib.Path) -> bool:
+        """Check if source and destination are the same, nothing to copy."""
+        return source.exists() and destination.exists() and source.samefile(destination)
+
     def sync_to(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+        if self._is_same_path(source, destination):
+            return
+
         if source.is_file():
-            shutil.copy2(source, destination)
+            _copy_file(str(source), str(destination))
         elif source.is_dir():
-            shutil.copytree(source, destination, dirs_exist_ok=True)
+            shutil.copytree(
+                source, destination, copy_function=_copy_file, dirs_exist_ok=True
+            )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
 
     def sync_from(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
+        if self._is_same_path(source, destination):
+            return
+
         if source.is_file():
-            shutil.copy2(source, destination)
+            _copy_file(str(source), str(destination))
         elif source.is_dir():
-            shutil.copytree(source, destination, dirs_exist_ok=True)
+            shutil.copytree(
+                source, destination, copy_function=_copy_file, dirs_exist_ok=True
+            )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
 
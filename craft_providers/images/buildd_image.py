@@ -1,15 +1,91 @@
 import enum
+import functools
 import logging
 import pathlib
 import subprocess
 from textwrap import dedent
-from time import sleep
+from time import monotonic, sleep
+from typing import Iterator, Optional
 
 from ..executors import Executor
+from ..util.concurrency import run_concurrently
 from .image import Image
 
 logger = logging.getLogger(__name__)
 
+# systemctl is-system-running states indicating systemd has finished booting.
+_RUNNING_STATES = (b"running", b"degraded")
+
+_ETH0_NETWORK_PATH = pathlib.Path("/etc/systemd/network/10-eth0.network")
+_ETH0_NETWORK_CONTENT = dedent(
+    """
+    [Match]
+    Name=eth0
+
+    [Network]
+    DHCP=ipv4
+    LinkLocalAddressing=ipv6
+
+    [DHCP]
+    RouteMetric=100
+    UseMTU=true
+    """
+).encode()
+
+_HOSTNAME_PATH = pathlib.Path("/etc/hostname")
+
+# Commonly required packages:
+# - dirmngr: for configuring apt GPG keyrings
+# - fuse: for snapd
+# - udev: for snapd
+# - snapd: depends on systemd-udevd and above dependencies.
+# - sudo
+_PACKAGES = "dirmngr fuse udev snapd sudo"
+
+# Seconds to wait for the package prefetch, after which the install fetches
+# anything missing itself.
+_PREFETCH_TIMEOUT = 300.0
+
+# Seconds to wait for systemd, and then network, to be ready.  Each budget
+# is shared by a blocking wait and any polling fallback which follows it.
+_WAIT_TIMEOUT = 20.0
+
+
+def _backoff(
+    *, deadline: float, initial: float = 0.05, maximum: float = 0.5
+) -> Iterator[None]:
+    """Yield until deadline passes, sleeping with exponential backoff between.
+
+    Always yields at least once.  Delay starts at initial and doubles after
+    each attempt, capped at maximum.
+
+    :param deadline: Time, in terms of time.monotonic(), to stop at.
+    """
+    delay = initial
+    while True:
+        yield
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            return
+
+        sleep(min(delay, remaining))
+        delay = min(delay * 2, maximum)
+
+
+def _stop_process(proc: subprocess.Popen) -> None:
+    """Terminate process if still running, killing it if it doesn't exit."""
+    if proc.poll() is not None:
+        return
+
+    # lxc forwards SIGTERM to the command in the instance.
+    proc.terminate()
+    try:
+        proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
 
 class BuilddImageAlias(enum.Enum):
     XENIAL = 16.04
@@ -37,115 +113,128 @@ class BuilddImage(Image):
         self.hostname = hostname
 
     def setup(self, *, executor: Executor) -> None:
-        executor.create_file(
-            destination=pathlib.Path("/etc/systemd/network/10-eth0.network"),
-            content=dedent(
-                """
-                [Match]
-                Name=eth0
-
-                [Network]
-                DHCP=ipv4
-                LinkLocalAddressing=ipv6
-
-                [DHCP]
-                RouteMetric=100
-                UseMTU=true
-                """
-            ).encode(),
-            file_mode="0644",
-        )
-
-        executor.create_file(
-            destination=pathlib.Path("/etc/hostname"),
-            content=self.hostname.encode(),
-            file_mode="0644",
+        # These steps are independent of one another, run them concurrently.
+        run_concurrently(
+            functools.partial(
+                executor.create_file,
+                destination=_ETH0_NETWORK_PATH,
+                content=_ETH0_NETWORK_CONTENT,
+                file_mode="0644",
+            ),
+            functools.partial(
+                executor.create_file,
+                destination=_HOSTNAME_PATH,
+                content=self.hostname.encode(),
+                file_mode="0644",
+            ),
         )
 
         self._setup_wait_for_systemd(executor=executor)
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-networkd"], check=True
-        )
-
-        executor.execute_run(
-            command=["systemctl", "restart", "systemd-networkd"], check=True
-        )
-
-        # Use resolv.conf managed by systemd-resolved.
-        executor.execute_run(
+        # Start downloading packages using the image's initial network
+        # configuration, overlapping with the network reconfiguration below.
+        # This is best-effort, the install will fetch anything missing.
+        prefetch_proc = executor.execute_popen(
             command=[
-                "ln",
-                "-sf",
-                "/run/systemd/resolve/resolv.conf",
-                "/etc/resolv.conf",
+                "sh",
+                "-e",
+                "-c",
+                "apt-get update\n"
+                "apt-get install --yes --download-only --no-install-recommends"
+                f" {_PACKAGES}\n",
             ],
-            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
         )
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-resolved"], check=True
-        )
+        try:
+            self._execute_script(
+                dedent(
+                    """
+                    # Use resolv.conf managed by systemd-resolved.
+                    ln -sf /run/systemd/resolve/resolv.conf /etc/resolv.conf
 
-        executor.execute_run(
-            command=["systemctl", "restart", "systemd-resolved"], check=True
-        )
+                    systemctl enable systemd-networkd systemd-resolved
 
-        executor.execute_run(
-            command=["systemctl", "restart", "systemd-networkd"], check=True
-        )
+                    # Restart (rather than start) to pick up the updated
+                    # configuration.
+                    systemctl restart systemd-networkd systemd-resolved
+                    """
+                ),
+                executor=executor,
+            )
 
-        self._setup_wait_for_network(executor=executor)
+            self._setup_wait_for_network(executor=executor)
 
-        executor.execute_run(command=["apt-get", "update"], check=True)
+            # Wait for prefetch to release the apt locks.
+            try:
+                prefetch_returncode: Optional[int] = prefetch_proc.wait(
+                    timeout=_PREFETCH_TIMEOUT
+                )
+            except subprocess.TimeoutExpired:
+                prefetch_returncode = None
+        finally:
+            # Never leave prefetch running (and holding the apt locks) on
+            # failure or timeout.
+            _stop_process(prefetch_proc)
 
-        # Install commonly required packages:
-        # - dirmngr: for configuring apt GPG keyrings
-        # - fuse: for snapd
-        # - udev: for snapd
-        executor.execute_run(
-            command=[
-                "apt-get",
-                "install",
-                "dirmngr",
-                "fuse",
-                "udev",
-                "--yes",
-            ],
-            check=True,
-        )
+        # Package lists only need to be refreshed again if prefetch failed.
+        if prefetch_returncode == 0:
+            script = ""
+        else:
+            logger.debug("Failed to prefetch packages.")
+            script = "apt-get update\n"
 
-        executor.execute_run(
-            command=["systemctl", "enable", "systemd-udevd"], check=True
-        )
-        executor.execute_run(
-            command=["systemctl", "start", "systemd-udevd"], check=True
+        # Install all packages in a single pass so that dpkg triggers are only
+        # processed once.
+        script += dedent(
+            f"""
+            DEBIAN_FRONTEND=noninteractive apt-get install --yes \\
+                --no-install-recommends -o Dpkg::Use-Pty=0 {_PACKAGES}
+            systemctl enable --now systemd-udevd snapd
+
+            # Starting the oneshot snapd.seeded.service blocks until seeding
+            # has completed, on all supported releases.
+            systemctl start snapd.seeded.service
+            """
         )
 
-        # Snapd depends on systemd-udev and above dependencies (fuse, udev).
+        self._execute_script(script, executor=executor)
+        self._mark_setup(executor=executor)
+
+    def _execute_script(self, script: str, *, executor: Executor) -> None:
+        """Run shell script in a single round-trip, stopping at first error."""
         executor.execute_run(
-            command=["apt-get", "install", "snapd", "sudo", "--yes"], check=True
+            command=["sh", "-e", "-c", script],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
         )
-        executor.execute_run(command=["systemctl", "start", "snapd"], check=True)
-
-        if self.alias.value >= 18.04:
-            executor.execute_run(
-                command=["snap", "wait", "system", "seed.loaded"], check=True
-            )
-        else:
-            # XXX: better way to ensure snapd is ready on core?
-            sleep(5)
 
     def _setup_wait_for_network(self, *, executor: Executor) -> None:
         logger.info("Waiting for network to be ready...")
-        for i in range(40):
+        deadline = monotonic() + _WAIT_TIMEOUT
+
+        # Block until systemd-networkd has configured eth0 rather than polling
+        # for it.  Name resolution may still lag slightly behind, so confirm
+        # with getent below (which will typically succeed on first attempt).
+        executor.execute_run(
+            command=[
+                "/lib/systemd/systemd-networkd-wait-online",
+                "--interface=eth0",
+                f"--timeout={int(_WAIT_TIMEOUT)}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # Poll only for what remains of the budget.
+        for _ in _backoff(deadline=deadline):
             proc = executor.execute_run(
                 command=["getent", "hosts", "snapcraft.io"], stdout=subprocess.DEVNULL
             )
             if proc.returncode == 0:
                 break
-
-            sleep(0.5)
         else:
             logger.warning("Failed to setup networking.")
 
@@ -154,16 +243,34 @@ class BuilddImage(Image):
         # - running: The system is fully operational. Process returncode: 0
         # - degraded: The system is operational but one or more units failed.
         #             Process returncode: 1
-        for i in range(40):
+        #
+        # Newer systemd (>= 240) supports blocking until start-up completes.
+        # Older versions reject --wait, leaving stdout empty, in which case
+        # we fall back to polling.
+        deadline = monotonic() + _WAIT_TIMEOUT
+        try:
+            proc = executor.execute_run(
+                command=["systemctl", "is-system-running", "--wait"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                timeout=_WAIT_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            logger.debug("Timed out waiting for systemd, falling back to polling.")
+        else:
+            if proc.stdout.strip() in _RUNNING_STATES:
+                return
+
+        # Poll only for what remains of the budget.
+        for _ in _backoff(deadline=deadline):
             proc = executor.execute_run(
                 command=["systemctl", "is-system-running"], stdout=subprocess.PIPE
             )
 
-            running_state = proc.stdout.decode().strip()
-            if running_state in ["running", "degraded"]:
+            running_state = proc.stdout.strip()
+            if running_state in _RUNNING_STATES:
                 break
 
             logger.debug(f"systemctl is-system-running: {running_state!r}")
-            sleep(0.5)
         else:
-            logger.warning(f"Systemd not rFailed to ait for systemd: {proc.stdout}.")
+            logger.warning(f"Failed to wait for systemd: {proc.stdout!r}.")
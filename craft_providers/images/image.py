@@ -1,10 +1,15 @@
 import logging
+import pathlib
+import subprocess
 from abc import ABC, abstractmethod
 
 from ..executors import Executor
 
 logger = logging.getLogger(__name__)
 
+# Written on completion of setup(), recording the image version and revision.
+_SETUP_MARKER_PATH = pathlib.Path("/etc/craft-providers/image-ready")
+
 
 class Image(ABC):
     """Image Configurator."""
@@ -18,6 +23,34 @@ class Image(ABC):
         self.version = version
         self.revision = revision
 
+        # Suffix used to name images derived from this one, e.g. "20-04-r0".
+        self.intermediate_suffix = f"{version.replace('.', '-')}-r{revision}"
+
+    def _get_setup_marker(self) -> bytes:
+        return f"{self.version} r{self.revision}\n".encode()
+
+    def _mark_setup(self, *, executor: Executor) -> None:
+        """Record that setup() has completed, see is_setup()."""
+        executor.create_file(
+            destination=_SETUP_MARKER_PATH,
+            content=self._get_setup_marker(),
+            file_mode="0644",
+        )
+
+    def is_setup(self, *, executor: Executor) -> bool:
+        """Check if setup() has completed for this image version and revision."""
+        proc = executor.execute_run(
+            command=["cat", _SETUP_MARKER_PATH.as_posix()],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+        return proc.returncode == 0 and proc.stdout == self._get_setup_marker()
+
     @abstractmethod
     def setup(self, *, executor: Executor) -> None:
+        """Configure executor's environment.
+
+        Implementations must call _mark_setup() on completion.
+        """
         ...
@@ -1,3 +1,4 @@
+from .api_client import APILXC, LXDAPIClient, LXDAPIError  # noqa: F401
 from .lxc import LXC, purge_project  # noqa: F401
 from .lxd import LXD  # noqa: F401
 from .lxd_instance import LXDInstance  # noqa: F401
@@ -0,0 +1,692 @@
+import contextlib
+import http.client
+import json
+import logging
+import os
+import pathlib
+import shutil
+import socket
+import threading
+import urllib.parse
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Union
+
+from .json_loader import _load_json
+from .lxc import LXC
+
+logger = logging.getLogger(__name__)
+
+# Chunk size used when streaming pulled files to disk.
+_COPY_BUFSIZE = 1024 * 1024
+
+
+def _find_socket() -> Optional[pathlib.Path]:
+    """Find LXD's unix socket, honouring LXD_DIR like the lxc client does."""
+    candidates = []
+
+    lxd_dir = os.environ.get("LXD_DIR")
+    if lxd_dir:
+        candidates.append(pathlib.Path(lxd_dir, "unix.socket"))
+
+    candidates.append(pathlib.Path("/var/snap/lxd/common/lxd/unix.socket"))
+    candidates.append(pathlib.Path("/var/lib/lxd/unix.socket"))
+
+    for candidate in candidates:
+        if candidate.exists():
+            return candidate
+
+    return None
+
+
+class LXDAPIError(RuntimeError):
+    """Error response from LXD API."""
+
+    def __init__(self, *, method: str, path: str, status: int, error: str) -> None:
+        super().__init__(f"LXD API {method} {path} failed ({status}): {error}")
+        self.method = method
+        self.path = path
+        self.status = status
+        self.error = error
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *, socket_path: pathlib.Path) -> None:
+        super().__init__("lxd")
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError:
+            sock.close()
+            raise
+
+        self.sock = sock
+
+
+class LXDAPIClient:
+    """Minimal client for the LXD REST API over its local unix socket.
+
+    A single HTTP/1.1 connection is kept alive and reused for all requests.
+
+    """
+
+    def __init__(self, *, socket_path: pathlib.Path) -> None:
+        self.socket_path = socket_path
+        self._connection: Optional[_UnixHTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _send(
+        self,
+        *,
+        method: str,
+        path: str,
+        body: Union[bytes, BinaryIO, None],
+        headers: Dict[str, str],
+    ) -> None:
+        assert self._connection is not None
+
+        if body is None or isinstance(body, bytes):
+            self._connection.request(method, path, body=body, headers=headers)
+            return
+
+        # Stream file bodies with sendfile(), avoiding a copy through userspace.
+        self._connection.putrequest(method, path)
+        for header, value in headers.items():
+            self._connection.putheader(header, value)
+        self._connection.putheader(
+            "Content-Length", str(os.fstat(body.fileno()).st_size)
+        )
+        self._connection.endheaders()
+
+        assert self._connection.sock is not None
+        self._connection.sock.sendfile(body, offset=0)
+
+    def _getresponse(
+        self,
+        *,
+        method: str,
+        path: str,
+        body: Union[bytes, BinaryIO, None],
+        headers: Dict[str, str],
+    ) -> http.client.HTTPResponse:
+        # LXD may close idle connections, retry once on a fresh connection
+        # if a reused one turns out to be stale.
+        for attempt in range(2):
+            reused = self._connection is not None
+            if self._connection is None:
+                self._connection = _UnixHTTPConnection(socket_path=self.socket_path)
+
+            try:
+                self._send(method=method, path=path, body=body, headers=headers)
+                return self._connection.getresponse()
+            except (
+                http.client.RemoteDisconnected,
+                BrokenPipeError,
+                ConnectionResetError,
+            ):
+                self._close_connection()
+                if not reused or attempt:
+                    raise
+            except BaseException:
+                # Connection may be left mid-request, don't reuse it.
+                self._close_connection()
+                raise
+
+        raise RuntimeError("unreachable")
+
+    def _close_connection(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @contextlib.contextmanager
+    def stream(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Dict[str, str]] = None,
+        body: Union[bytes, BinaryIO, None] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Iterator[http.client.HTTPResponse]:
+        """Make raw API request, yielding the unread response.
+
+        The connection is held until the context exits, so the response body
+        can be streamed rather than buffered.
+
+        :raises LXDAPIError: on error response.
+        """
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+
+        logger.debug(f"LXD API request: {method} {path}")
+        with self._lock:
+            response = self._getresponse(
+                method=method, path=path, body=body, headers=headers or dict()
+            )
+            if response.status >= 400:
+                try:
+                    data = response.read()
+                except BaseException:
+                    self._close_connection()
+                    raise
+
+                try:
+                    error = _load_json(data).get("error", "")
+                except ValueError:
+                    error = response.reason
+                raise LXDAPIError(
+                    method=method, path=path, status=response.status, error=error
+                )
+
+            try:
+                yield response
+
+                # Drain anything left unread so the connection can be reused.
+                response.read()
+            except BaseException:
+                # Response may be partially read, don't reuse the connection.
+                self._close_connection()
+                raise
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        params: Optional[Dict[str, str]] = None,
+        body: Optional[Any] = None,
+    ) -> Dict[str, Any]:
+        """Make API request, returning the decoded response.
+
+        Asynchronous operations are waited upon.
+
+        :raises LXDAPIError: on error response or failed operation.
+        """
+        encoded_body = None
+        headers = {}
+        if body is not None:
+            encoded_body = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+
+        with self.stream(
+            method, path, params=params, body=encoded_body, headers=headers
+        ) as response:
+            data = _load_json(response.read())
+
+        if data.get("type") == "error":
+            raise LXDAPIError(
+                method=method,
+                path=path,
+                status=data.get("error_code", response.status),
+                error=data.get("error", ""),
+            )
+
+        if data.get("type") == "async":
+            return self.wait_operation(data["operation"])
+
+        return data
+
+    def wait_operation(self, operation: str) -> Dict[str, Any]:
+        """Wait for operation to complete.
+
+        :raises LXDAPIError: if operation failed.
+        """
+        data = self.request("GET", f"{operation}/wait")
+        metadata = data.get("metadata") or dict()
+        if metadata.get("status_code") != 200:
+            raise LXDAPIError(
+                method="GET",
+                path=operation,
+                status=metadata.get("status_code", 0),
+                error=metadata.get("err", ""),
+            )
+
+        return data
+
+    def connect(self) -> None:
+        """Open connection, if not already open.
+
+        :raises OSError: if unable to connect to socket.
+        """
+        with self._lock:
+            if self._connection is None:
+                connection = _UnixHTTPConnection(socket_path=self.socket_path)
+                connection.connect()
+                self._connection = connection
+
+    def close(self) -> None:
+        """Close connection, if open."""
+        with self._lock:
+            self._close_connection()
+
+
+def _quote(name: str) -> str:
+    return urllib.parse.quote(name, safe="")
+
+
+class APILXC(LXC):
+    """Wrapper for lxc, using the LXD API for supported local operations.
+
+    Queries and instance state changes on the "local" remote are made through
+    a kept-alive connection to the LXD unix socket, avoiding the cost of an
+    `lxc` process for each.  Other operations, remotes, and hosts where the
+    socket is unavailable fall back to the `lxc` command.
+
+    Single file transfers are streamed over the same connection, pushing with
+    sendfile() and pulling in large chunks, rather than through `lxc file`.
+
+    Note that list() results do not include the instance "state" block.
+
+    """
+
+    def __init__(
+        self,
+        *,
+        lxc_path: pathlib.Path = pathlib.Path("/snap/bin/lxc"),
+        socket_path: Optional[pathlib.Path] = None,
+    ):
+        super().__init__(lxc_path=lxc_path)
+
+        if socket_path is None:
+            socket_path = _find_socket()
+
+        if socket_path is None:
+            self.api: Optional[LXDAPIClient] = None
+        else:
+            self.api = LXDAPIClient(socket_path=socket_path)
+
+        self._api_verified = False
+        self._api_lock = threading.Lock()
+
+    def _get_api(self, remote: str) -> Optional[LXDAPIClient]:
+        """Get API client if usable for remote."""
+        api = self.api
+        if remote != "local" or api is None:
+            return None
+
+        if self._api_verified:
+            return api
+
+        # Verify socket is accessible (e.g. user is in lxd group) on first use,
+        # once for all threads.
+        with self._api_lock:
+            if self.api is None:
+                return None
+
+            if not self._api_verified:
+                try:
+                    api.connect()
+                except OSError as error:
+                    logger.info(f"LXD API unavailable, using lxc: {error}")
+                    self.api = None
+                    return None
+
+                self._api_verified = True
+
+        return api
+
+    def close(self) -> None:
+        if self.api is not None:
+            self.api.close()
+
+    def config_device_show(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().config_device_show(
+                instance=instance, project=project, remote=remote
+            )
+
+        data = api.request(
+            "GET", f"/1.0/instances/{_quote(instance)}", params=dict(project=project)
+        )
+        return data["metadata"]["devices"]
+
+    def image_list(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> List[Dict[str, Any]]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().image_list(project=project, remote=remote)
+
+        data = api.request(
+            "GET", "/1.0/images", params=dict(project=project, recursion="1")
+        )
+        return data["metadata"]
+
+    def info(
+        self, *, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().info(project=project, remote=remote)
+
+        data = api.request("GET", "/1.0", params=dict(project=project))
+        return data["metadata"]
+
+    def list(
+        self,
+        *,
+        instance: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> List[Dict[str, Any]]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().list(instance=instance, project=project, remote=remote)
+
+        if instance is None:
+            data = api.request(
+                "GET", "/1.0/instances", params=dict(project=project, recursion="1")
+            )
+            return data["metadata"]
+
+        try:
+            data = api.request(
+                "GET",
+                f"/1.0/instances/{_quote(instance)}",
+                params=dict(project=project),
+            )
+        except LXDAPIError as error:
+            if error.status == 404:
+                return []
+            raise
+
+        return [data["metadata"]]
+
+    def profile_show(
+        self, *, profile: str, project: str = "default", remote: str = "local"
+    ) -> Dict[str, Any]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().profile_show(profile=profile, project=project, remote=remote)
+
+        data = api.request(
+            "GET", f"/1.0/profiles/{_quote(profile)}", params=dict(project=project)
+        )
+        return data["metadata"]
+
+    def project_exists(self, *, project: str, remote: str = "local") -> bool:
+        api = self._get_api(remote)
+        if api is None:
+            return super().project_exists(project=project, remote=remote)
+
+        try:
+            api.request("GET", f"/1.0/projects/{_quote(project)}")
+        except LXDAPIError as error:
+            if error.status == 404:
+                return False
+            raise
+
+        return True
+
+    def project_list(self, remote: str = "local") -> List[str]:
+        api = self._get_api(remote)
+        if api is None:
+            return super().project_list(remote=remote)
+
+        data = api.request("GET", "/1.0/projects")
+        return sorted(
+            urllib.parse.unquote(url.rsplit("/", 1)[-1]) for url in data["metadata"]
+        )
+
+    def start(
+        self, *, instance: str, project: str = "default", remote: str = "local"
+    ) -> None:
+        api = self._get_api(remote)
+        if api is None:
+            return super().start(instance=instance, project=project, remote=remote)
+
+        api.request(
+            "PUT",
+            f"/1.0/instances/{_quote(instance)}/state",
+            params=dict(project=project),
+            body=dict(action="start"),
+        )
+
+    def stop(
+        self,
+        *,
+        instance: str,
+        project: str = "default",
+        remote: str = "local",
+        force=True,
+        timeout: int = -1,
+    ) -> None:
+        api = self._get_api(remote)
+        if api is None:
+            return super().stop(
+                instance=instance,
+                project=project,
+                remote=remote,
+                force=force,
+                timeout=timeout,
+            )
+
+        api.request(
+            "PUT",
+            f"/1.0/instances/{_quote(instance)}/state",
+            params=dict(project=project),
+            body=dict(action="stop", force=force, timeout=timeout),
+        )
+
+    def _file_exists(
+        self, *, api: LXDAPIClient, instance: str, path: pathlib.Path, project: str
+    ) -> bool:
+        try:
+            with api.stream(
+                "GET",
+                f"/1.0/instances/{_quote(instance)}/files",
+                params=dict(path=path.as_posix(), project=project),
+            ):
+                pass
+        except LXDAPIError as error:
+            if error.status == 404:
+                return False
+            raise
+
+        return True
+
+    def _file_create_parents(
+        self, *, api: LXDAPIClient, instance: str, path: pathlib.Path, project: str
+    ) -> None:
+        """Create missing parent directories of path, as --create-dirs does."""
+        missing = []
+        for parent in path.parents:
+            if self._file_exists(
+                api=api, instance=instance, path=parent, project=project
+            ):
+                break
+            missing.append(parent)
+
+        for parent in reversed(missing):
+            with api.stream(
+                "POST",
+                f"/1.0/instances/{_quote(instance)}/files",
+                params=dict(path=parent.as_posix(), project=project),
+                body=b"",
+                headers={"X-LXD-type": "directory"},
+            ):
+                pass
+
+    def _file_push(
+        self,
+        *,
+        api: LXDAPIClient,
+        instance: str,
+        body: Union[bytes, BinaryIO],
+        destination: pathlib.Path,
+        create_dirs: bool,
+        gid: str,
+        uid: str,
+        mode: Optional[str],
+        project: str,
+    ) -> None:
+        if create_dirs:
+            self._file_create_parents(
+                api=api, instance=instance, path=destination, project=project
+            )
+
+        headers = {"X-LXD-type": "file", "X-LXD-write": "overwrite"}
+        if mode:
+            headers["X-LXD-mode"] = mode
+        if gid != "-1":
+            headers["X-LXD-gid"] = gid
+        if uid != "-1":
+            headers["X-LXD-uid"] = uid
+
+        with api.stream(
+            "POST",
+            f"/1.0/instances/{_quote(instance)}/files",
+            params=dict(path=destination.as_posix(), project=project),
+            body=body,
+            headers=headers,
+        ):
+            pass
+
+    def file_pull(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        recursive: bool = False,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        api = self._get_api(remote)
+        if api is None or recursive:
+            return super().file_pull(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                project=project,
+                remote=remote,
+            )
+
+        if destination.is_dir():
+            destination = destination / source.name
+        elif create_dirs:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+
+        with api.stream(
+            "GET",
+            f"/1.0/instances/{_quote(instance)}/files",
+            params=dict(path=source.as_posix(), project=project),
+        ) as response:
+            kind = response.getheader("X-LXD-type")
+            if kind == "file":
+                with destination.open("wb") as stream:
+                    shutil.copyfileobj(response, stream, _COPY_BUFSIZE)
+
+                mode = response.getheader("X-LXD-mode")
+                if mode:
+                    destination.chmod(int(mode, 8))
+
+        # Leave directories and symlinks to lxc, which knows how to handle them.
+        if kind != "file":
+            super().file_pull(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                project=project,
+                remote=remote,
+            )
+
+    def file_push(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        recursive: bool = False,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        api = self._get_api(remote)
+        if api is None or recursive or not source.is_file():
+            return super().file_push(
+                instance=instance,
+                source=source,
+                destination=destination,
+                create_dirs=create_dirs,
+                recursive=recursive,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                project=project,
+                remote=remote,
+            )
+
+        with source.open("rb") as stream:
+            # Like lxc, default to the source file's ownership and mode.
+            stat = os.fstat(stream.fileno())
+            if mode is None:
+                mode = f"{stat.st_mode & 0o7777:04o}"
+            if gid == "-1":
+                gid = str(stat.st_gid)
+            if uid == "-1":
+                uid = str(stat.st_uid)
+
+            self._file_push(
+                api=api,
+                instance=instance,
+                body=stream,
+                destination=destination,
+                create_dirs=create_dirs,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                project=project,
+            )
+
+    def file_push_content(
+        self,
+        *,
+        instance: str,
+        content: bytes,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        api = self._get_api(remote)
+        if api is None:
+            return super().file_push_content(
+                instance=instance,
+                content=content,
+                destination=destination,
+                create_dirs=create_dirs,
+                gid=gid,
+                uid=uid,
+                mode=mode,
+                project=project,
+                remote=remote,
+            )
+
+        self._file_push(
+            api=api,
+            instance=instance,
+            body=content,
+            destination=destination,
+            create_dirs=create_dirs,
+            gid=gid,
+            uid=uid,
+            mode=mode,
+            project=project,
+        )
@@ -0,0 +1,84 @@
+import contextlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from .json_loader import _load_json
+
+if TYPE_CHECKING:
+    from .lxc import LXC
+
+logger = logging.getLogger(__name__)
+
+# Image lists are shared between processes (e.g. repeated CI invocations),
+# so keep them only briefly in case images are modified elsewhere.
+IMAGE_LIST_TTL = 60.0
+
+
+def _get_cache_dir() -> pathlib.Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME")
+    if cache_home:
+        return pathlib.Path(cache_home, "craft-providers", "lxd")
+
+    return pathlib.Path.home() / ".cache" / "craft-providers" / "lxd"
+
+
+def _get_image_list_path(*, project: str, remote: str) -> pathlib.Path:
+    return _get_cache_dir() / f"images-{project}-{remote}.json"
+
+
+def _store(path: pathlib.Path, data: Any) -> None:
+    """Atomically write data to path, ignoring failures."""
+    temp_path: Optional[str] = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=f".{path.name}.", delete=False
+        ) as tf:
+            temp_path = tf.name
+            tf.write(json.dumps(data).encode())
+
+        os.replace(temp_path, path)
+    except OSError as error:
+        logger.debug(f"Failed to write cache {path}: {error}")
+        if temp_path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(temp_path)
+
+
+def get_image_list(
+    *,
+    lxc: "LXC",
+    project: str = "default",
+    remote: str = "local",
+    ttl: float = IMAGE_LIST_TTL,
+) -> List[Dict[str, Any]]:
+    """Get image list, from cache if written within ttl seconds.
+
+    A ttl of zero forces the list to be refreshed.
+    """
+    path = _get_image_list_path(project=project, remote=remote)
+    try:
+        if time.time() - path.stat().st_mtime < ttl:
+            return _load_json(path.read_bytes())
+    except (OSError, ValueError):
+        pass
+
+    images = lxc.image_list(project=project, remote=remote)
+    _store(path, images)
+    return images
+
+
+def invalidate_image_list(*, project: str = "default", remote: str = "local") -> None:
+    """Drop cached image list."""
+    path = _get_image_list_path(project=project, remote=remote)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    except OSError as error:
+        logger.debug(f"Failed to remove cache {path}: {error}")
@@ -0,0 +1,16 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+def _load_json(data: bytes) -> Any:
+    # Prefer orjson (if installed) which is considerably faster and parses
+    # bytes directly, skipping the decode.
+    if orjson is not None:
+        return orjson.loads(data)
+
+    return json.loads(data)
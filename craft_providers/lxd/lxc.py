@@ -1,17 +1,30 @@
+import json
 import logging
 import pathlib
 import shlex
-import shutil
 import subprocess
+import urllib.parse
 from typing import Any, Dict, List, Optional
 
-import yaml
-
+from ..util import path
+from . import cache
+from .json_loader import _load_json
 from .yaml_loader import _load_yaml
 
 logger = logging.getLogger(__name__)
 
 
+def _find_lxc() -> pathlib.Path:
+    # Lookup is cached by which(), see path.invalidate_which_cache().
+    lxc_path = path.which("lxc")
+
+    # Default to standard snap location if not found in PATH.
+    if lxc_path is None:
+        return pathlib.Path("/snap/bin/lxc")
+
+    return lxc_path
+
+
 class LXC:
     """Wrapper for lxc."""
 
@@ -20,10 +33,7 @@ class LXC:
         *,
         lxc_path: pathlib.Path = pathlib.Path("/snap/bin/lxc"),
     ):
-        if lxc_path is None:
-            self.lxc_path: pathlib.Path = pathlib.Path("lxc")
-        else:
-            self.lxc_path = lxc_path
+        self.lxc_path = lxc_path
 
     def _run(
         self,
@@ -37,9 +47,10 @@ class LXC:
     ) -> subprocess.CompletedProcess:
         """Execute command in instance, allowing output to console."""
         command = [str(self.lxc_path), "--project", project, *command]
-        quoted = " ".join([shlex.quote(c) for c in command])
 
-        logger.warning(f"Executing on host: {quoted}")
+        # Skip quoting the command if it won't be logged.
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(f"Executing on host: {shlex.join(command)}")
 
         try:
             if input is not None:
@@ -56,6 +67,12 @@ class LXC:
 
         return proc
 
+    def close(self) -> None:
+        """Release any resources held, e.g. connections.
+
+        lxc may still be used afterwards, resources are re-acquired on demand.
+        """
+
     def config_device_add_disk(
         self,
         *,
@@ -87,12 +104,10 @@ class LXC:
     def config_device_show(
         self, *, instance: str, project: str = "default", remote: str = "local"
     ) -> Dict[str, Any]:
-        proc = self._run(
-            command=["config", "device", "show", f"{remote}:{instance}"],
-            project=project,
+        instance_config = self.query(
+            path=f"/1.0/instances/{instance}", project=project, remote=remote
         )
-
-        return _load_yaml(proc.stdout)
+        return instance_config["devices"]
 
     def config_set(
         self,
@@ -131,6 +146,7 @@ class LXC:
         command: List[str],
         instance: str,
         cwd: str = "/root",
+        env: Optional[Dict[str, str]] = None,
         mode: str = "auto",
         project: str = "default",
         remote: str = "local",
@@ -147,6 +163,10 @@ class LXC:
         if cwd != "/root":
             final_cmd.extend(["--cwd", cwd])
 
+        if env:
+            for key, value in env.items():
+                final_cmd.extend(["--env", f"{key}={value}"])
+
         if mode != "auto":
             final_cmd.extend(["--mode", mode])
 
@@ -160,24 +180,30 @@ class LXC:
         command: List[str],
         instance: str,
         cwd: str = "/root",
+        env: Optional[Dict[str, str]] = None,
         mode: str = "auto",
         project: str = "default",
         remote: str = "local",
         runner=subprocess.run,
         **kwargs,
     ):
-        """Execute command in instance with specified runner."""
+        """Execute command in instance with specified runner.
+
+        :param env: Environment variables to set in the instance.
+        """
         command = self._formulate_command(
             command=command,
             instance=instance,
             cwd=cwd,
+            env=env,
             mode=mode,
             project=project,
             remote=remote,
         )
 
-        quoted = " ".join([shlex.quote(c) for c in command])
-        logger.warning(f"Executing in container: {quoted}")
+        # Skip quoting the command if it won't be logged.
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(f"Executing in container: {shlex.join(command)}")
 
         return runner(command, **kwargs)
 
@@ -211,25 +237,24 @@ class LXC:
             project=project,
         )
 
-    def file_push(
+    def _formulate_file_push_command(
         self,
         *,
         instance: str,
-        source: pathlib.Path,
+        source: str,
         destination: pathlib.Path,
         create_dirs: bool = True,
         recursive: bool = False,
         gid: str = "-1",
         uid: str = "-1",
         mode: Optional[str] = None,
-        project: str = "default",
         remote: str = "local",
-    ) -> None:
-        """Create file with content and file mode."""
+    ) -> List[str]:
+        """Formulate file push command."""
         command = [
             "file",
             "push",
-            source.as_posix(),
+            source,
             f"{remote}:{instance}{destination.as_posix()}",
         ]
 
@@ -246,22 +271,78 @@ class LXC:
             command.append(f"--gid={gid}")
 
         if uid != "-1":
-            command.append(f"--uid={gid}")
+            command.append(f"--uid={uid}")
+
+        return command
+
+    def file_push(
+        self,
+        *,
+        instance: str,
+        source: pathlib.Path,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        recursive: bool = False,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Push file from host to instance."""
+        command = self._formulate_file_push_command(
+            instance=instance,
+            source=source.as_posix(),
+            destination=destination,
+            create_dirs=create_dirs,
+            recursive=recursive,
+            gid=gid,
+            uid=uid,
+            mode=mode,
+            remote=remote,
+        )
+
+        self._run(
+            command=command,
+            project=project,
+        )
+
+    def file_push_content(
+        self,
+        *,
+        instance: str,
+        content: bytes,
+        destination: pathlib.Path,
+        create_dirs: bool = True,
+        gid: str = "-1",
+        uid: str = "-1",
+        mode: Optional[str] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> None:
+        """Create file with content and file mode, streamed via stdin."""
+        command = self._formulate_file_push_command(
+            instance=instance,
+            source="-",
+            destination=destination,
+            create_dirs=create_dirs,
+            gid=gid,
+            uid=uid,
+            mode=mode,
+            remote=remote,
+        )
 
         self._run(
             command=command,
             project=project,
+            input=content,
         )
 
     def info(
         self, *, project: str = "default", remote: str = "local"
     ) -> Dict[str, Any]:
         """Get server config that instance is running on."""
-        proc = self._run(
-            command=["info", remote + ":"],
-            project=project,
-        )
-        return _load_yaml(proc.stdout)
+        return self.query(path="/1.0", project=project, remote=remote)
 
     def launch(
         self,
@@ -308,6 +389,7 @@ class LXC:
             ],
             project=project,
         )
+        cache.invalidate_image_list(project=project, remote=remote)
 
     def image_delete(
         self, *, image: str, project: str = "default", remote: str = "local"
@@ -321,17 +403,18 @@ class LXC:
             ],
             project=project,
         )
+        cache.invalidate_image_list(project=project, remote=remote)
 
     def image_list(
         self, *, project: str = "default", remote: str = "local"
     ) -> List[Dict[str, Any]]:
         """List instances."""
         proc = self._run(
-            command=["image", "list", f"{remote}:", "--format=yaml"],
+            command=["image", "list", f"{remote}:", "--format=json"],
             project=project,
         )
 
-        return _load_yaml(proc.stdout)
+        return _load_json(proc.stdout)
 
     def list(
         self,
@@ -340,19 +423,45 @@ class LXC:
         project: str = "default",
         remote: str = "local",
     ) -> List[Dict[str, Any]]:
-        """List instances."""
-        command = ["list", "--format=yaml"]
-        if instance is None:
-            instance = ""
+        """List instances, or the exact instance if specified.
 
-        command.append(f"{remote}:{instance}")
+        A single instance is fetched directly, rather than listing (along with
+        full runtime state) every instance its name prefixes.
+        """
+        if instance is not None:
+            try:
+                return [
+                    self.query(
+                        path=f"/1.0/instances/{instance}",
+                        project=project,
+                        remote=remote,
+                    )
+                ]
+            except subprocess.CalledProcessError:
+                # lxc doesn't expose the response status, and error messages
+                # vary between LXD versions.  Confirm the instance is missing
+                # from the project's instance list (just URLs, so cheap) rather
+                # than mistaking any other failure, e.g. a missing project,
+                # for it.  Failing to list the project raises that error.
+                urls = self.query(path="/1.0/instances", project=project, remote=remote)
+
+                # URLs have a ?project= query outside of the default project.
+                paths = {
+                    urllib.parse.unquote(urllib.parse.urlparse(url).path)
+                    for url in urls
+                }
+                if f"/1.0/instances/{instance}" not in paths:
+                    return []
+                raise
+
+        command = ["list", "--format=json", f"{remote}:"]
 
         proc = self._run(
             command=command,
             project=project,
         )
 
-        return _load_yaml(proc.stdout)
+        return _load_json(proc.stdout)
 
     def profile_edit(
         self,
@@ -362,35 +471,50 @@ class LXC:
         project: str = "default",
         remote: str = "local",
     ) -> None:
-        encoded_config = yaml.dump(config).encode()
-        self._run(
-            command=["profile", "edit", f"{remote}:{profile}"],
+        """Replace profile configuration.
+
+        Sent as JSON through the API, avoiding serializing to YAML for
+        `lxc profile edit`.
+        """
+        self.query(
+            path=f"/1.0/profiles/{profile}",
+            method="PUT",
+            data=config,
             project=project,
-            input=encoded_config,
+            remote=remote,
         )
 
     def profile_show(
         self, *, profile: str, project: str = "default", remote: str = "local"
     ) -> Dict[str, Any]:
         """Get profile."""
-        proc = self._run(
-            command=["profile", "show", f"{remote}:{profile}"], project=project
+        return self.query(
+            path=f"/1.0/profiles/{profile}", project=project, remote=remote
         )
 
-        return _load_yaml(proc.stdout)
-
     def project_create(self, *, project: str, remote: str = "local") -> None:
         """Create project."""
         self._run(command=["project", "create", f"{remote}:{project}"])
 
+    def project_exists(self, *, project: str, remote: str = "local") -> bool:
+        """Check if project exists."""
+        proc = self._run(
+            command=["project", "show", f"{remote}:{project}"],
+            check=False,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        return proc.returncode == 0
+
     def project_list(self, remote: str = "local") -> List[str]:
         """Get list of projects.
 
         :returns: dictionary with remote name mapping to config.
         """
-        proc = self._run(command=["project", "list", remote, "--format=yaml"])
+        proc = self._run(command=["project", "list", remote, "--format=json"])
 
-        projects = _load_yaml(proc.stdout)
+        projects = _load_json(proc.stdout)
         return sorted([p["name"] for p in projects])
 
     def project_delete(self, *, project: str, remote: str = "local") -> None:
@@ -404,17 +528,56 @@ class LXC:
         instance: str,
         project: str,
         force: bool = True,
+        compression: Optional[str] = None,
         remote: str = "local",
     ) -> None:
-        """Create project."""
+        """Publish instance as image.
+
+        :param compression: Compression algorithm to use, e.g. "none" for
+            images which are only used locally.
+        """
         command = ["publish", "--alias", alias, f"{remote}:{instance}"]
         if force:
             command.append("--force")
 
+        if compression is not None:
+            command.append(f"--compression={compression}")
+
         self._run(
             command=command,
             project=project,
         )
+        cache.invalidate_image_list(project=project, remote=remote)
+
+    def query(
+        self,
+        *,
+        path: str,
+        method: str = "GET",
+        data: Optional[Any] = None,
+        project: str = "default",
+        remote: str = "local",
+    ) -> Any:
+        """Make LXD API request through lxc, waiting on any operation.
+
+        Returns JSON rather than the YAML (or table) of equivalent commands,
+        which is considerably faster to parse.
+
+        :returns: Decoded response metadata, if any.
+        """
+        command = ["query", "--wait", "--request", method]
+        if data is not None:
+            command.extend(["--data", json.dumps(data)])
+
+        query = urllib.parse.urlencode(dict(project=project))
+        command.append(f"{remote}:{path}?{query}")
+
+        # Keep any warnings on stderr from corrupting the output.
+        proc = self._run(command=command, project=project, stderr=subprocess.PIPE)
+        if not proc.stdout.strip():
+            return None
+
+        return _load_json(proc.stdout)
 
     def remote_add(self, *, remote: str, addr: str, protocol: str) -> None:
         """Add a public remote."""
@@ -433,11 +596,7 @@ class LXC:
         if self.lxc_path.exists():
             return
 
-        lxc_path = shutil.which("lxc")
-        if lxc_path is None:
-            lxc_path = "/snap/bin/lxc"
-
-        self.lxc_path = pathlib.Path(lxc_path)
+        self.lxc_path = _find_lxc()
         if not self.lxc_path.exists():
             raise RuntimeError("lxc not found in PATH.")
 
@@ -471,8 +630,7 @@ class LXC:
 def purge_project(*, lxc: LXC, project: str = "default", remote: str = "local") -> None:
     """Remove project and any associated bits."""
     # with contextlib.suppress(subprocess.CalledProcessError):
-    projects = lxc.project_list(remote=remote)
-    if project not in projects:
+    if not lxc.project_exists(project=project, remote=remote):
         logger.warning(f"Attempted to purge non-existent project {project}.")
         return
 
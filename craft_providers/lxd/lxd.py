@@ -1,12 +1,44 @@
+import functools
 import logging
 import pathlib
-import shutil
 import subprocess
-from typing import Optional
+from typing import Optional, Tuple
+
+from ..util import path
 
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def _get_lxd_version(lxd_path: str) -> str:
+    """Query LXD version, caching the result for the given lxd binary."""
+    proc = subprocess.run(
+        [lxd_path, "version"],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    return proc.stdout.decode().strip()
+
+
+def _parse_version(version: str) -> Tuple[int, int]:
+    """Parse (major, minor) from version string, e.g. "4.10" -> (4, 10)."""
+    major, minor = version.split(".")[:2]
+    return int(major), int(minor)
+
+
+def _find_lxd() -> pathlib.Path:
+    # Lookup is cached by which(), see path.invalidate_which_cache().
+    lxd_path = path.which("lxd")
+
+    # Default to standard snap location if not found in PATH.
+    if lxd_path is None:
+        return pathlib.Path("/snap/bin/lxd")
+
+    return lxd_path
+
+
 class LXD:
     """LXD Interface."""
 
@@ -16,46 +48,47 @@ class LXD:
         lxd_path: Optional[pathlib.Path] = None,
     ):
         if lxd_path is None:
-            self.lxd_path = self._find_lxd()
+            self.lxd_path = _find_lxd()
         else:
             self.lxd_path = lxd_path
 
     def _verify_lxd_version(self) -> None:
-        proc = subprocess.run(
-            [self.lxd_path, "version"],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-        version = float(proc.stdout)
-        if version < 4.8:
+        # Compare as integer tuple, float would treat 4.10 as 4.1.
+        version = _get_lxd_version(str(self.lxd_path))
+        if _parse_version(version) < (4, 8):
             raise RuntimeError(
-                "LXD version {version!r} is unsupported. Must be >= 4.8."
+                f"LXD version {version!r} is unsupported. Must be >= 4.8."
             )
 
-    def _find_lxd(self) -> pathlib.Path:
-        lxd_path = shutil.which("lxd")
-
-        # Default to standard snap location if not found in PATH.
-        if lxd_path is None:
-            lxd_path = "/snap/bin/lxd"
-
-        return pathlib.Path(lxd_path)
-
     def setup(self) -> None:
         """Ensure LXD is installed with required version."""
         if not self.lxd_path.exists():
             subprocess.run(["sudo", "snap", "install", "lxd"], check=True)
 
             # Make sure lxd is found in PATH.
-            self.lxd_path = self._find_lxd()
+            path.invalidate_which_cache()
+            self.lxd_path = _find_lxd()
             if not self.lxd_path.exists():
                 raise RuntimeError("Failed to install LXD, or lxd not found in PATH.")
 
-            subprocess.run(
-                ["sudo", str(self.lxd_path), "waitready", "--timeout=30"], check=True
-            )
+            # `lxd version` doesn't need the daemon, so verify while waiting
+            # for it to come up.
+            waitready_command = [
+                "sudo",
+                str(self.lxd_path),
+                "waitready",
+                "--timeout=30",
+            ]
+            waitready_proc = subprocess.Popen(waitready_command)
+            try:
+                self._verify_lxd_version()
+            finally:
+                returncode = waitready_proc.wait()
+
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, waitready_command)
+
             subprocess.run(["sudo", str(self.lxd_path), "init", "--auto"], check=True)
+            return
 
         self._verify_lxd_version()
@@ -1,15 +1,32 @@
 import logging
 import os
 import pathlib
+import shlex
 import subprocess
-import tempfile
-from typing import Any, Dict, List, Optional
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 from ..executors import Executor
+from ..util import path
 from .lxc import LXC
+from .shell_session import ShellSession
 
 logger = logging.getLogger(__name__)
 
+# Host capabilities are stable for the lifetime of the LXD daemon, but allow
+# them to be refreshed periodically in case it is reconfigured.
+_HOST_INFO_TTL = 300.0
+
+# Host mknod support, shared by all instances on a remote.  Maps remote name
+# to the time of query and result.
+_HOST_SUPPORTS_MKNOD_CACHE: Dict[str, Tuple[float, bool]] = dict()
+
+# Instance state and devices are cached briefly to coalesce back-to-back
+# queries (e.g. exists() followed by is_running()).  Any operation which
+# mutates the instance invalidates the caches, lifecycle operations then
+# record their known outcome.
+_STATE_CACHE_TTL = 0.25
+
 
 class LXDInstance(Executor):
     """LXD Instance Lifecycle."""
@@ -22,6 +39,8 @@ class LXDInstance(Executor):
         remote: str = "local",
         lxc: Optional[LXC] = None,
     ):
+        super().__init__()
+
         self.name = name
         self.project = project
         self.remote = remote
@@ -30,6 +49,16 @@ class LXDInstance(Executor):
         else:
             self.lxc = lxc
 
+        self._state_cache: Optional[Tuple[float, Optional[Dict[str, Any]]]] = None
+        self._devices_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._rsync_supported: Optional[bool] = None
+        self._shell = ShellSession(spawn=self._spawn_shell)
+
+    def _invalidate_caches(self) -> None:
+        self._state_cache = None
+        self._devices_cache = None
+        self._rsync_supported = None
+
     def create_file(
         self,
         *,
@@ -40,13 +69,9 @@ class LXDInstance(Executor):
         uid: int = 0,
     ) -> None:
         """Create file with content and file mode."""
-        with tempfile.NamedTemporaryFile(delete=False) as tf:
-            tf.write(content)
-            tf.flush()
-
-        self.lxc.file_push(
+        self.lxc.file_push_content(
             instance=self.name,
-            source=pathlib.Path(tf.name),
+            content=content,
             destination=destination,
             mode=file_mode,
             gid=str(gid),
@@ -55,15 +80,16 @@ class LXDInstance(Executor):
             remote=self.remote,
         )
 
-        os.unlink(tf.name)
-
     def delete(self, force: bool = True) -> None:
-        return self.lxc.delete(
+        self._shell.close()
+        self._invalidate_caches()
+        self.lxc.delete(
             instance=self.name,
             project=self.project,
             remote=self.remote,
             force=force,
         )
+        self._record_state(None)
 
     def execute_popen(self, command: List[str], **kwargs) -> subprocess.Popen:
         return self.lxc.exec(
@@ -76,6 +102,16 @@ class LXDInstance(Executor):
         )
 
     def execute_run(self, command: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """Execute command in instance, using subprocess.run() semantics.
+
+        Commands which do not require input, a timeout, or captured stderr,
+        and whose output is captured or discarded, are run through a
+        persistent shell session to avoid spawning `lxc exec` for each
+        command.
+        """
+        if ShellSession.supports(kwargs):
+            return self._shell.run(command, **kwargs)
+
         return self.lxc.exec(
             instance=self.name,
             command=command,
@@ -89,30 +125,78 @@ class LXDInstance(Executor):
         return self.get_state() is not None
 
     def get_state(self) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        if self._state_cache is not None:
+            timestamp, cached_state = self._state_cache
+            if now - timestamp < _STATE_CACHE_TTL:
+                return cached_state
+
         instances = self.lxc.list(
             instance=self.name, project=self.project, remote=self.remote
         )
 
-        # lxc returns a filter instances starting with instance name rather
-        # than the exact instance.  Find the exact match...
+        # lxc.list() returns at most the exact instance, but match on name
+        # rather than rely on it.
+        state = None
         for instance in instances:
             if instance["name"] == self.name:
-                return instance
+                state = instance
+                break
 
-        return None
+        self._state_cache = (now, state)
+        return state
+
+    def _get_devices(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if self._devices_cache is not None:
+            timestamp, cached_devices = self._devices_cache
+            if now - timestamp < _STATE_CACHE_TTL:
+                return cached_devices
 
-    def is_mounted(self, *, source: pathlib.Path, destination: pathlib.Path) -> bool:
         devices = self.lxc.config_device_show(
             instance=self.name, project=self.project, remote=self.remote
         )
-        disks = [d for d in devices.values() if d.get("type") == "disk"]
+
+        self._devices_cache = (now, devices)
+        return devices
+
+    def is_mounted(self, *, source: pathlib.Path, destination: pathlib.Path) -> bool:
+        devices = self._get_devices()
+        source_path = source.as_posix()
+        destination_path = destination.as_posix()
 
         return any(
-            disk.get("path") == destination.as_posix()
-            and disk.get("source") == source.as_posix()
-            for disk in disks
+            device.get("type") == "disk"
+            and device.get("path") == destination_path
+            and device.get("source") == source_path
+            for device in devices.values()
         )
 
+    def resolve_mounted_path(self, host_path: pathlib.Path) -> Optional[pathlib.Path]:
+        if not self.supports_mount():
+            return None
+
+        host_path = host_path.absolute()
+
+        # Find the most specific disk device containing host path.
+        resolved = None
+        resolved_source_parts = 0
+        for device in self._get_devices().values():
+            if device.get("type") != "disk" or "source" not in device:
+                continue
+
+            source = pathlib.Path(device["source"])
+            try:
+                relative_path = host_path.relative_to(source)
+            except ValueError:
+                continue
+
+            if len(source.parts) > resolved_source_parts:
+                resolved = pathlib.Path(device["path"]) / relative_path
+                resolved_source_parts = len(source.parts)
+
+        return resolved
+
     def is_running(self) -> bool:
         """Check if instance is running."""
         state = self.get_state()
@@ -126,15 +210,24 @@ class LXDInstance(Executor):
         *,
         image: str,
         image_remote: str,
-        uid: str = str(os.getuid()),
+        uid: Optional[str] = None,
         ephemeral: bool = True,
     ) -> None:
+        """Launch instance.
+
+        :param uid: Host user ID to map to root in the instance, defaulting to
+            the current process's user ID.
+        """
+        if uid is None:
+            uid = str(os.getuid())
+
         config_keys = dict()
         config_keys["raw.idmap"] = f"both {uid!s} 0"
 
         if self._host_supports_mknod():
             config_keys["security.syscalls.intercept.mknod"] = "true"
 
+        self._invalidate_caches()
         self.lxc.launch(
             config_keys=config_keys,
             ephemeral=ephemeral,
@@ -148,52 +241,204 @@ class LXDInstance(Executor):
     def mount(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
         """Mount host source directory to target mount point.
 
-        Checks first to see if already mounted."""
-        if self.is_mounted(source=source, destination=destination):
-            return
+        The device is added without querying devices first.  Only if that
+        fails is it checked whether the mount already exists, so an unmounted
+        directory costs a single lxc call."""
+        self._invalidate_caches()
+        try:
+            self.lxc.config_device_add_disk(
+                instance=self.name,
+                source=source,
+                destination=destination,
+                project=self.project,
+                remote=self.remote,
+            )
+        except subprocess.CalledProcessError:
+            if self.is_mounted(source=source, destination=destination):
+                return
+            raise
 
-        self.lxc.config_device_add_disk(
-            instance=self.name,
-            source=source,
-            destination=destination,
-            project=self.project,
-            remote=self.remote,
+    def _get_target_kind(self, target: pathlib.Path) -> Optional[str]:
+        """Determine if target is a "file" or "directory" with a single stat.
+
+        Symlinks are followed, matching `test -f` and `test -d`.
+
+        :returns: "file", "directory", or None if target does not exist or is
+            some other type.
+        """
+        proc = self.execute_run(
+            command=["stat", "-L", "-c", "%F", target.as_posix()],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
         )
+        if proc.returncode != 0:
+            return None
+
+        file_type = proc.stdout.strip()
+        if file_type in (b"regular file", b"regular empty file"):
+            return "file"
+
+        if file_type == b"directory":
+            return "directory"
+
+        return None
 
     def _host_supports_mknod(self) -> bool:
         """Enable mknod in container, if possible.
 
         See: https://linuxcontainers.org/lxd/docs/master/syscall-interception
+
+        Result is cached per remote for _HOST_INFO_TTL seconds.
         """
+        now = time.monotonic()
+        cached = _HOST_SUPPORTS_MKNOD_CACHE.get(self.remote)
+        if cached is not None:
+            timestamp, supported = cached
+            if now - timestamp < _HOST_INFO_TTL:
+                return supported
+
         cfg = self.lxc.info(project=self.project, remote=self.remote)
         env = cfg.get("environment", dict())
         kernel_features = env.get("kernel_features", dict())
         seccomp_listener = kernel_features.get("seccomp_listener", "false")
 
-        return seccomp_listener == "true"
+        supported = seccomp_listener == "true"
+        _HOST_SUPPORTS_MKNOD_CACHE[self.remote] = (now, supported)
+        return supported
+
+    def _get_last_state(self) -> Optional[Dict[str, Any]]:
+        """Get last queried state, regardless of age."""
+        if self._state_cache is None:
+            return None
+
+        return self._state_cache[1]
+
+    def _record_state(self, state: Optional[Dict[str, Any]]) -> None:
+        """Record known outcome of a completed lifecycle operation.
+
+        Start, stop and delete wait for the operation to complete, so the
+        resulting state is known without querying LXD again.
+        """
+        self._state_cache = (time.monotonic(), state)
 
     def start(self) -> None:
+        last_state = self._get_last_state()
+        self._invalidate_caches()
         self.lxc.start(instance=self.name, project=self.project, remote=self.remote)
 
+        if last_state is not None:
+            self._record_state(dict(last_state, status="Running"))
+
     def stop(self) -> None:
+        last_state = self._get_last_state()
+        self._shell.close()
+        self._invalidate_caches()
         self.lxc.stop(instance=self.name, project=self.project, remote=self.remote)
 
+        # Ephemeral instances are deleted when stopped.
+        if last_state is not None:
+            if last_state.get("ephemeral"):
+                self._record_state(None)
+            else:
+                self._record_state(dict(last_state, status="Stopped"))
+
+    def _spawn_shell(self) -> subprocess.Popen:
+        return self.lxc.exec(
+            instance=self.name,
+            command=["sh"],
+            project=self.project,
+            remote=self.remote,
+            runner=subprocess.Popen,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
     def supports_mount(self) -> bool:
         return self.remote == "local"
 
+    def _supports_rsync(self) -> bool:
+        """Check if rsync is available on both host and instance."""
+        if self._rsync_supported is None:
+            if path.which("rsync") is None:
+                self._rsync_supported = False
+            else:
+                proc = self.execute_run(
+                    command=["which", "rsync"],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                self._rsync_supported = proc.returncode == 0
+
+        return self._rsync_supported
+
+    def _rsync(self, *, source: str, destination: str) -> None:
+        """Mirror source directory to destination, deleting extraneous files.
+
+        The instance is reached by running rsync's remote end through
+        `lxc exec`, with the instance name as the rsync host.
+        """
+        # rsync appends the host and remote command to the shell command,
+        # splitting it into words with shell-like quoting.
+        rsh_script = (
+            "lxc=$0 project=$1 remote=$2 instance=$3; shift 3; "
+            'exec "$lxc" exec --project "$project" "$remote:$instance" -- "$@"'
+        )
+        rsh = shlex.join(
+            ["sh", "-c", rsh_script, str(self.lxc.lxc_path), self.project, self.remote]
+        )
+
+        command = [
+            str(path.which_required("rsync")),
+            "--archive",
+            "--delete",
+            "--numeric-ids",
+            # Send paths over the protocol rather than the remote command
+            # line, which has no shell to undo rsync's escaping.
+            "--protect-args",
+            f"--rsh={rsh}",
+        ]
+
+        # Only worth the CPU when data leaves the host.
+        if self.remote != "local":
+            command.append("--compress")
+
+        command += [f"{source}/", f"{destination}/"]
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Executing on host: {shlex.join(command)}")
+
+        subprocess.run(command, check=True)
+
+    def rsync_directory_from(
+        self, *, source: pathlib.Path, destination: pathlib.Path
+    ) -> None:
+        """Sync directory from instance using rsync, see _supports_rsync()."""
+        destination.mkdir(parents=True, exist_ok=True)
+        self._rsync(
+            source=f"{self.name}:{source.as_posix()}", destination=str(destination)
+        )
+
+    def rsync_directory_to(
+        self, *, source: pathlib.Path, destination: pathlib.Path
+    ) -> None:
+        """Sync directory to instance using rsync, see _supports_rsync()."""
+        self.execute_run(
+            ["mkdir", "-p", destination.as_posix()],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        self._rsync(
+            source=str(source), destination=f"{self.name}:{destination.as_posix()}"
+        )
+
     def sync_from(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
         logger.info(f"Syncing env:{source} -> host:{destination}...")
-        # TODO: check if mount makes source == destination, skip if so.
-        if self.is_target_file(source):
-            self.lxc.file_pull(
-                instance=self.name,
-                source=source,
-                destination=destination,
-                project=self.project,
-                remote=self.remote,
-                create_dirs=True,
-            )
-        elif self.is_target_directory(target=source):
+        if self.resolve_mounted_path(destination) == source:
+            logger.info(f"Skipping sync, host:{destination} is mounted.")
+            return
+
+        kind = self._get_target_kind(source)
+        if kind == "file":
             self.lxc.file_pull(
                 instance=self.name,
                 source=source,
@@ -201,16 +446,21 @@ class LXDInstance(Executor):
                 project=self.project,
                 remote=self.remote,
                 create_dirs=True,
-                recursive=True,
             )
-            # TODO: use mount() if available
-            self.naive_directory_sync_from(source=source, destination=destination)
+        elif kind == "directory":
+            if self._supports_rsync():
+                self.rsync_directory_from(source=source, destination=destination)
+            else:
+                self.naive_directory_sync_from(source=source, destination=destination)
         else:
             raise FileNotFoundError(f"Source {source} not found.")
 
     def sync_to(self, *, source: pathlib.Path, destination: pathlib.Path) -> None:
-        # TODO: check if mounted, skip sync if source == destination
         logger.info(f"Syncing host:{source} -> env:{destination}...")
+        if self.resolve_mounted_path(source) == destination:
+            logger.info(f"Skipping sync, host:{source} is mounted.")
+            return
+
         if source.is_file():
             self.lxc.file_push(
                 instance=self.name,
@@ -220,9 +470,11 @@ class LXDInstance(Executor):
                 remote=self.remote,
             )
         elif source.is_dir():
-            # TODO: use mount() if available
-            self.naive_directory_sync_to(
-                source=source, destination=destination, delete=True
-            )
+            if self._supports_rsync():
+                self.rsync_directory_to(source=source, destination=destination)
+            else:
+                self.naive_directory_sync_to(
+                    source=source, destination=destination, delete=True
+                )
         else:
             raise FileNotFoundError(f"Source {source} not found.")
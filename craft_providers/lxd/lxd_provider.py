@@ -1,9 +1,11 @@
 import logging
+import subprocess
 from typing import Optional
 
 from ..executed_provider import ExecutedProvider
 from ..images import Image
-from . import LXC, LXD, LXDInstance
+from ..util.concurrency import run_concurrently
+from . import APILXC, LXC, LXD, LXDInstance, cache
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,21 @@ class LXDProvider(ExecutedProvider):
 
     """
 
+    __slots__ = (
+        "image",
+        "instance",
+        "instance_name",
+        "image_remote_addr",
+        "image_remote_name",
+        "image_remote_protocol",
+        "lxc",
+        "lxd",
+        "use_ephemeral_instances",
+        "use_intermediate_image",
+        "project",
+        "remote",
+    )
+
     def __init__(
         self,
         *,
@@ -39,7 +56,7 @@ class LXDProvider(ExecutedProvider):
         self.image_remote_protocol = image_remote_protocol
 
         if lxc is None:
-            self.lxc = LXC()
+            self.lxc: LXC = APILXC()
         else:
             self.lxc = lxc
 
@@ -54,19 +71,42 @@ class LXDProvider(ExecutedProvider):
         self.remote = remote
 
     def setup(self) -> LXDInstance:
-        self.lxd.setup()
-        self.lxc.setup()
+        def setup_lxc() -> None:
+            self.lxc.setup()
+            self._setup_image_remote()
+            self._setup_project()
 
-        self._setup_image_remote()
+        # lxc is provided by LXD, so it can only be set up concurrently with
+        # LXD's version verification if LXD is already installed.
+        if self.lxd.lxd_path.exists():
+            run_concurrently(self.lxd.setup, setup_lxc)
+        else:
+            self.lxd.setup()
+            setup_lxc()
 
         if self.use_intermediate_image:
             intermediate_image = self._setup_intermediate_image()
-            self.instance = self._setup_instance(
-                instance=self.instance_name,
-                image=intermediate_image,
-                image_remote=self.remote,
-                ephemeral=self.use_ephemeral_instances,
-            )
+            try:
+                self.instance = self._setup_instance(
+                    instance=self.instance_name,
+                    image=intermediate_image,
+                    image_remote=self.remote,
+                    ephemeral=self.use_ephemeral_instances,
+                )
+            except subprocess.CalledProcessError:
+                # The cached image list may predate the intermediate image
+                # being deleted elsewhere.  If so, recreate it and retry once.
+                if self._has_intermediate_image(ttl=0):
+                    raise
+
+                logger.info("Intermediate image is gone, recreating it.")
+                intermediate_image = self._setup_intermediate_image()
+                self.instance = self._setup_instance(
+                    instance=self.instance_name,
+                    image=intermediate_image,
+                    image_remote=self.remote,
+                    ephemeral=self.use_ephemeral_instances,
+                )
         else:
             self.instance = self._setup_instance(
                 instance=self.instance_name,
@@ -78,7 +118,13 @@ class LXDProvider(ExecutedProvider):
         return self.instance
 
     def _setup_image_remote(self) -> None:
-        """Add a public remote."""
+        """Add a public remote, if not already configured.
+
+        Remotes are lxc client configuration rather than server state, so
+        there is no API to check and add in a single request.  A single
+        remote_list() is made when the remote already exists (the common
+        case).
+        """
         remotes = self.lxc.remote_list()
         remote = remotes.get(self.image_remote_name)
 
@@ -86,10 +132,11 @@ class LXDProvider(ExecutedProvider):
         if remote is not None:
             if (
                 remote.get("addr") != self.image_remote_addr
-                and remote.get("protocol") != self.image_remote_protocol
+                or remote.get("protocol") != self.image_remote_protocol
             ):
                 raise RuntimeError(
-                    f"Remote configuration does not match for {self.remote!r}."
+                    "Remote configuration does not match for "
+                    f"{self.image_remote_name!r}."
                 )
             return
 
@@ -114,35 +161,45 @@ class LXDProvider(ExecutedProvider):
             lxc=self.lxc,
         )
 
-        if lxd_instance.exists():
-            # TODO: add verififcation that instance matches
-            if not lxd_instance.is_running():
-                lxd_instance.start()
-        else:
+        # TODO: add verififcation that existing instance matches
+        state = lxd_instance.get_state()
+        if state is None:
             lxd_instance.launch(
                 image=image,
                 image_remote=image_remote,
                 ephemeral=ephemeral,
             )
+        elif state.get("status") != "Running":
+            lxd_instance.start()
+        elif self.image.is_setup(executor=lxd_instance):
+            # Already running and configured, no need to wait for it or set
+            # it up again.
+            logger.info("Using existing instance.")
+            return lxd_instance
 
         self.image.setup(executor=lxd_instance)
         return lxd_instance
 
-    def _setup_intermediate_image(self) -> str:
-        intermediate_name = "-".join(
-            [
-                self.image_remote_name,
-                self.image.version.replace(".", "-"),
-                f"r{self.image.revision}",
-            ]
+    def _get_intermediate_name(self) -> str:
+        return f"{self.image_remote_name}-{self.image.intermediate_suffix}"
+
+    def _has_intermediate_image(self, *, ttl: float) -> bool:
+        """Check image list, cached for up to ttl seconds, for intermediate image."""
+        images = cache.get_image_list(
+            lxc=self.lxc, project=self.project, remote=self.remote, ttl=ttl
         )
+        aliases = {alias["name"] for image in images for alias in image["aliases"]}
+        return self._get_intermediate_name() in aliases
 
-        images = self.lxc.image_list(project=self.project, remote=self.remote)
-        for image in images:
-            for alias in image["aliases"]:
-                if intermediate_name == alias["name"]:
-                    logger.info("Using intermediate image.")
-                    return intermediate_name
+    def _setup_intermediate_image(self) -> str:
+        intermediate_name = self._get_intermediate_name()
+
+        # Check the cached image list first, but refresh it before deciding
+        # that the intermediate image must be created.
+        for ttl in [cache.IMAGE_LIST_TTL, 0]:
+            if self._has_intermediate_image(ttl=ttl):
+                logger.info("Using intermediate image.")
+                return intermediate_name
 
         # Intermediate instances cannot be ephemeral. Publishing may fail.
         intermediate_instance = self._setup_instance(
@@ -152,13 +209,19 @@ class LXDProvider(ExecutedProvider):
             ephemeral=False,
         )
 
-        # Publish intermediate image.
+        # Stop instance prior to publishing.  Publishing with force would
+        # stop it too, but then restart it only for it to be deleted.
+        intermediate_instance.stop()
+
+        # Publish intermediate image.  It is never transferred off the host,
+        # so skip compressing it.
         self.lxc.publish(
             alias=intermediate_name,
             instance=intermediate_name,
             project=self.project,
             remote=self.remote,
-            force=True,
+            force=False,
+            compression="none",
         )
 
         # Nuke it.
@@ -166,19 +229,40 @@ class LXDProvider(ExecutedProvider):
         return intermediate_name
 
     def _setup_project(self) -> None:
-        projects = self.lxc.project_list(remote=self.remote)
-        if self.project in projects:
+        """Create project, if it does not exist."""
+        if self.lxc.project_exists(project=self.project, remote=self.remote):
             return
 
+        self.lxc.project_create(project=self.project, remote=self.remote)
+
+        # A new project's default profile is empty, copy the default project's
+        # so that instances get a root disk and network.
+        default_cfg = self.lxc.profile_show(
+            profile="default", project="default", remote=self.remote
+        )
+        self.lxc.profile_edit(
+            profile="default",
+            project=self.project,
+            config=default_cfg,
+            remote=self.remote,
+        )
+
     def teardown(self, *, clean: bool = False) -> None:
+        try:
+            self._teardown_instance(clean=clean)
+        finally:
+            self.lxc.close()
+
+    def _teardown_instance(self, *, clean: bool) -> None:
         if self.instance is None:
             return
 
-        if not self.instance.exists():
+        state = self.instance.get_state()
+        if state is None:
             return
 
-        if self.instance.is_running():
-            self.instance.stop()
-
         if clean:
+            # Forced deletion stops the instance in the same operation.
             self.instance.delete(force=True)
+        elif state.get("status") == "Running":
+            self.instance.stop()
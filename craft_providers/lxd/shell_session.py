@@ -0,0 +1,156 @@
+import logging
+import shlex
+import subprocess
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Output redirections supported by the session, keyed by subprocess constant.
+#
+# Output is never passed through to the host (stdout=None): it would be
+# relayed via the session's pipe while stderr is written directly, reordering
+# interleaved output compared to a one-shot `lxc exec`.
+_STDOUT_REDIRECTS = {
+    subprocess.PIPE: "",
+    subprocess.DEVNULL: " >/dev/null",
+}
+_STDERR_REDIRECTS = {
+    None: "",
+    subprocess.DEVNULL: " 2>/dev/null",
+    subprocess.STDOUT: " 2>&1",
+}
+
+
+class ShellSession:
+    """Long-lived shell in an instance, used to run commands without paying
+    for a new `lxc exec` per command.
+
+    Each command runs in a subshell with stdin redirected from /dev/null, so
+    it cannot consume the session's input or alter its state.  Completion is
+    detected by a unique marker line carrying the exit code.  If a command's
+    output cannot be read through to its marker (e.g. on KeyboardInterrupt),
+    the shell is discarded so no later command can pick up its output.
+
+    :param spawn: Callable returning a Popen of `sh` running in the instance
+        with stdin and stdout piped.
+
+    """
+
+    def __init__(self, *, spawn: Callable[[], subprocess.Popen]) -> None:
+        self._spawn = spawn
+        self._lock = threading.Lock()
+        self._marker = f"__craft_providers_{uuid.uuid4().hex}__".encode()
+        self._proc: Optional[subprocess.Popen] = None
+
+    @staticmethod
+    def supports(kwargs: Dict[str, Any]) -> bool:
+        """Check if execute_run() arguments can be handled by a session.
+
+        Only commands with stdout captured or discarded are supported, see
+        _STDOUT_REDIRECTS.
+        """
+        if not set(kwargs).issubset({"check", "stdout", "stderr"}):
+            return False
+
+        return (
+            kwargs.get("stdout") in _STDOUT_REDIRECTS
+            and kwargs.get("stderr") in _STDERR_REDIRECTS
+        )
+
+    def close(self) -> None:
+        """Terminate the shell, if running."""
+        with self._lock:
+            proc = self._proc
+            self._proc = None
+
+        if proc is None:
+            return
+
+        if proc.stdin:
+            proc.stdin.close()
+
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    def _discard(self) -> None:
+        """Kill the shell, whose state is unknown.  Lock must be held."""
+        proc = self._proc
+        self._proc = None
+        if proc is None:
+            return
+
+        proc.kill()
+        proc.wait()
+        for pipe in (proc.stdin, proc.stdout):
+            if pipe:
+                pipe.close()
+
+    def _get_proc(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = self._spawn()
+
+        return self._proc
+
+    def run(
+        self,
+        command: List[str],
+        *,
+        check: bool = False,
+        stdout: int = subprocess.PIPE,
+        stderr: Optional[int] = None,
+    ) -> subprocess.CompletedProcess:
+        """Run command in session, with subprocess.run() semantics."""
+        quoted = shlex.join(command)
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(f"Executing in container session: {quoted}")
+
+        line = (
+            f"({quoted}) </dev/null"
+            f"{_STDOUT_REDIRECTS[stdout]}{_STDERR_REDIRECTS[stderr]}; "
+            f"printf '\\n%s %d\\n' {self._marker.decode()} $?\n"
+        )
+
+        with self._lock:
+            try:
+                returncode, output = self._communicate(line.encode())
+            except BaseException:
+                self._discard()
+                raise
+
+        proc_stdout = b"".join(output) if stdout == subprocess.PIPE else None
+        if check and returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, output=proc_stdout)
+
+        return subprocess.CompletedProcess(
+            args=command, returncode=returncode, stdout=proc_stdout
+        )
+
+    def _communicate(self, line: bytes) -> Tuple[int, List[bytes]]:
+        """Write command line to shell and read output through to its marker.
+
+        Lock must be held.
+
+        :returns: Tuple of exit code and output lines.
+        """
+        proc = self._get_proc()
+        assert proc.stdin is not None
+        assert proc.stdout is not None
+
+        proc.stdin.write(line)
+        proc.stdin.flush()
+
+        output: List[bytes] = []
+        for data in iter(proc.stdout.readline, b""):
+            if data.startswith(self._marker):
+                # Drop the newline printed ahead of the marker.
+                output[-1] = output[-1][:-1]
+                return int(data.split()[1]), output
+
+            output.append(data)
+
+        raise RuntimeError("Shell session terminated unexpectedly.")
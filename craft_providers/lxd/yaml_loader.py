@@ -1,20 +1,37 @@
+import functools
 import logging
 from typing import Any
 
-import yaml
-
 logger = logging.getLogger(__name__)
 
 
-class _YamlLoader(yaml.SafeLoader):
-    pass
+@functools.lru_cache(maxsize=None)
+def _get_loader() -> Any:
+    """Build YAML loader on first use.
 
+    YAML is only needed for `lxc remote list`, so defer importing yaml until
+    then to keep it off the startup path.
+    """
+    import yaml
+
+    # Prefer the libyaml-based loader (if available), which is considerably
+    # faster.
+    safe_loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+    class _YamlLoader(safe_loader):  # type: ignore
+        pass
 
-def _load_yaml(data: bytes) -> Any:
     # Unfortunately some timestamps used by LXD are incompatible with the
     # python's timestamp.  Drop the implicit resolver to avoid this.
     _YamlLoader.yaml_implicit_resolvers = {
         k: [r for r in v if r[0] != "tag:yaml.org,2002:timestamp"]
         for k, v in yaml.SafeLoader.yaml_implicit_resolvers.items()
     }
-    return yaml.load(data, Loader=_YamlLoader)
+
+    return _YamlLoader
+
+
+def _load_yaml(data: bytes) -> Any:
+    import yaml
+
+    return yaml.load(data, Loader=_get_loader())
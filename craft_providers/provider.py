@@ -12,6 +12,8 @@ class Provider(ABC):
 
     """
 
+    __slots__ = ("interactive",)
+
     def __init__(
         self,
         *,
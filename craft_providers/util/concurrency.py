@@ -0,0 +1,12 @@
+from concurrent import futures
+from typing import Callable
+
+
+def run_concurrently(*calls: Callable[[], object]) -> None:
+    """Run independent calls in parallel, raising the first failure (if any)."""
+    with futures.ThreadPoolExecutor(max_workers=8) as pool:
+        pending = [pool.submit(call) for call in calls]
+        done, _ = futures.wait(pending, return_when=futures.FIRST_EXCEPTION)
+
+    for future in done:
+        future.result()
@@ -1,10 +1,16 @@
+import functools
 import pathlib
 import shutil
 from typing import Optional
 
 
+@functools.lru_cache(maxsize=None)
 def which(command: str) -> Optional[pathlib.Path]:
-    """A pathlib.Path wrapper for shutil.which()."""
+    """A pathlib.Path wrapper for shutil.which().
+
+    Results are cached for the lifetime of the process, see
+    invalidate_which_cache().
+    """
     path = shutil.which(command)
     if path:
         return pathlib.Path(path)
@@ -17,3 +23,8 @@ def which_required(command: str) -> pathlib.Path:
     if path is None:
         raise RuntimeError(f"Missing required command {command!r}.")
     return path
+
+
+def invalidate_which_cache() -> None:
+    """Clear cached which() results, e.g. after installing a command."""
+    which.cache_clear()
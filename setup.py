@@ -14,6 +14,11 @@ requirements = [
     "pyyaml>=5.3.1",
 ]
 
+extras_requirements = {
+    # Faster parsing of LXD's JSON output, used when available.
+    "orjson": ["orjson"],
+}
+
 setup_requirements = [
     "pytest-runner",
 ]
@@ -34,6 +39,7 @@ setup(
         "Programming Language :: Python :: 3.8",
     ],
     description="Craft provider tooling",
+    extras_require=extras_requirements,
     entry_points={
         "console_scripts": [
             "craft_providers=craft_providers.cli:main",
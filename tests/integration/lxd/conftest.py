@@ -13,7 +13,7 @@ def run(cmd, **kwargs):
     )
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def lxd():
     lxc_path = pathlib.Path("/snap/bin/lxc")
     if lxc_path.exists():
@@ -28,7 +28,7 @@ def lxd():
         run(["sudo", "snap", "remove", "lxd"])
 
 
-@pytest.fixture()
+@pytest.fixture(scope="session")
 def lxc(lxd):
     yield LXC()
 
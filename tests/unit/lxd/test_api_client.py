@@ -0,0 +1,304 @@
+import http.server
+import json
+import os
+import pathlib
+import socketserver
+import tempfile
+import threading
+import urllib.parse
+
+import pytest
+
+from craft_providers.lxd.api_client import APILXC, LXDAPIClient, LXDAPIError
+
+
+class _FakeLXD:
+    """Fake LXD API state, served over a unix socket."""
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        self.close_after_response = False
+        self.instances = {"t1": {"name": "t1", "status": "Stopped", "devices": {}}}
+        self.dirs = {"/", "/root"}
+        self.files = {}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.server.lxd.connections += 1
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def address_string(self):
+        return "unix"
+
+    def _send(self, data, *, status=200, raw=None, headers=None):
+        body = raw if raw is not None else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or dict()).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+        # Drop the connection without telling the client, as LXD may do for
+        # idle connections.
+        if self.server.lxd.close_after_response:
+            self.close_connection = True
+
+    def _sync(self, metadata, **kwargs):
+        self._send(dict(type="sync", status_code=200, metadata=metadata), **kwargs)
+
+    def _error(self, status, error):
+        self._send(dict(type="error", error_code=status, error=error), status=status)
+
+    def _handle(self):
+        lxd = self.server.lxd
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        lxd.requests.append((self.command, self.path, dict(self.headers), body))
+
+        parts = url.path.split("/")
+        if url.path.startswith("/1.0/operations/"):
+            if parts[3] == "ok":
+                return self._sync(dict(status_code=200))
+            return self._sync(dict(status_code=400, err="operation failed"))
+
+        if url.path == "/1.0/instances":
+            return self._sync(list(lxd.instances.values()))
+
+        if len(parts) < 4 or parts[2] != "instances":
+            return self._error(404, "not found")
+
+        name = urllib.parse.unquote(parts[3])
+        if name not in lxd.instances:
+            return self._error(404, "Instance not found")
+
+        if len(parts) == 4:
+            return self._sync(lxd.instances[name])
+
+        if parts[4] == "state":
+            operation = "ok" if json.loads(body)["action"] == "start" else "fail"
+            return self._send(
+                dict(
+                    type="async",
+                    status_code=100,
+                    operation=f"/1.0/operations/{operation}",
+                )
+            )
+
+        path = params["path"]
+        if self.command == "POST":
+            if os.path.dirname(path) not in lxd.dirs:
+                return self._error(404, "Parent not found")
+
+            if self.headers.get("X-LXD-type") == "directory":
+                lxd.dirs.add(path)
+            else:
+                lxd.files[path] = (body, self.headers.get("X-LXD-mode"))
+            return self._sync(dict())
+
+        if path in lxd.dirs:
+            return self._sync([], headers={"X-LXD-type": "directory"})
+
+        if path in lxd.files:
+            content, mode = lxd.files[path]
+            return self._send(
+                None, raw=content, headers={"X-LXD-type": "file", "X-LXD-mode": mode}
+            )
+
+        return self._error(404, "not found")
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def lxd():
+    return _FakeLXD()
+
+
+@pytest.fixture
+def socket_path(lxd):
+    # Keep clear of the unix socket path length limit.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = pathlib.Path(tmp_dir, "unix.socket")
+        server = _Server(str(path), _Handler)
+        server.lxd = lxd
+        thread = threading.Thread(
+            target=server.serve_forever, args=(0.05,), daemon=True
+        )
+        thread.start()
+
+        yield path
+
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def client(socket_path):
+    client = LXDAPIClient(socket_path=socket_path)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def lxc(socket_path):
+    lxc = APILXC(socket_path=socket_path)
+    yield lxc
+    lxc.close()
+
+
+def test_request_reuses_connection(client, lxd):
+    for _ in range(3):
+        data = client.request("GET", "/1.0/instances/t1")
+        assert data["metadata"]["name"] == "t1"
+
+    assert len(lxd.requests) == 3
+    assert lxd.connections == 1
+
+
+def test_request_retries_stale_connection(client, lxd):
+    lxd.close_after_response = True
+
+    for _ in range(3):
+        data = client.request("GET", "/1.0/instances/t1")
+        assert data["metadata"]["name"] == "t1"
+
+    assert len(lxd.requests) == 3
+    assert lxd.connections == 3
+
+
+def test_request_error(client, lxd):
+    with pytest.raises(LXDAPIError) as raised:
+        client.request("GET", "/1.0/instances/missing")
+
+    assert raised.value.status == 404
+    assert raised.value.error == "Instance not found"
+
+    # The error body is read, so the connection remains usable.
+    client.request("GET", "/1.0/instances/t1")
+    assert lxd.connections == 1
+
+
+def test_request_failure_closes_connection(client, lxd, monkeypatch):
+    client.request("GET", "/1.0/instances/t1")
+
+    def interrupted_send(**kwargs):
+        raise KeyboardInterrupt()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(client, "_send", interrupted_send)
+        with pytest.raises(KeyboardInterrupt):
+            client.request("GET", "/1.0/instances/t1")
+
+    assert client._connection is None
+
+    data = client.request("GET", "/1.0/instances/t1")
+    assert data["metadata"]["name"] == "t1"
+    assert lxd.connections == 2
+
+
+def test_stream_failure_closes_connection(client, lxd):
+    with pytest.raises(RuntimeError):
+        with client.stream("GET", "/1.0/instances/t1"):
+            raise RuntimeError("interrupted")
+
+    assert client._connection is None
+
+    client.request("GET", "/1.0/instances/t1")
+    assert lxd.connections == 2
+
+
+def test_request_waits_for_operation(client, lxd):
+    data = client.request("PUT", "/1.0/instances/t1/state", body=dict(action="start"))
+
+    assert data["metadata"]["status_code"] == 200
+    assert [request[1] for request in lxd.requests] == [
+        "/1.0/instances/t1/state",
+        "/1.0/operations/ok/wait",
+    ]
+
+
+def test_request_failed_operation(client):
+    with pytest.raises(LXDAPIError) as raised:
+        client.request("PUT", "/1.0/instances/t1/state", body=dict(action="stop"))
+
+    assert raised.value.status == 400
+    assert raised.value.error == "operation failed"
+
+
+def test_list(lxc):
+    assert [i["name"] for i in lxc.list()] == ["t1"]
+    assert [i["name"] for i in lxc.list(instance="t1")] == ["t1"]
+    assert lxc.list(instance="t") == []
+
+
+def test_file_push_content_creates_parents(lxc, lxd):
+    lxc.file_push_content(
+        instance="t1",
+        content=b"content",
+        destination=pathlib.Path("/root/a/b/file"),
+        mode="0600",
+    )
+
+    assert lxd.files["/root/a/b/file"] == (b"content", "0600")
+    assert {"/root/a", "/root/a/b"} <= lxd.dirs
+    assert lxd.connections == 1
+
+
+def test_file_push_streams_file(lxc, lxd, tmp_path):
+    source = tmp_path / "source"
+    source.write_bytes(b"x" * 100000)
+    source.chmod(0o640)
+
+    lxc.file_push(instance="t1", source=source, destination=pathlib.Path("/root/f"))
+
+    assert lxd.files["/root/f"] == (b"x" * 100000, "0640")
+
+
+def test_file_pull(lxc, lxd, tmp_path):
+    lxd.files["/root/f"] = (b"pulled", "0600")
+    destination = tmp_path / "new" / "f"
+
+    lxc.file_pull(
+        instance="t1", source=pathlib.Path("/root/f"), destination=destination
+    )
+
+    assert destination.read_bytes() == b"pulled"
+    assert destination.stat().st_mode & 0o7777 == 0o600
+
+
+def test_get_api_unavailable_socket_concurrently(tmp_path):
+    lxc = APILXC(socket_path=tmp_path / "missing.socket")
+    results = []
+    errors = []
+
+    def get_api():
+        try:
+            results.append(lxc._get_api("local"))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=get_api) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert results == [None] * 8
+    assert lxc.api is None
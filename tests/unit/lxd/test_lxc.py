@@ -0,0 +1,77 @@
+import subprocess
+from textwrap import dedent
+
+import pytest
+
+from craft_providers.lxd import LXC
+
+
+@pytest.fixture
+def fake_lxc(tmp_path):
+    """Make a fake lxc, answering instance queries from a shell case."""
+
+    def make(cases: str) -> LXC:
+        path = tmp_path / "lxc"
+        path.write_text(
+            dedent(
+                """\
+                #!/bin/sh
+                for arg; do target="$arg"; done
+                case "$target" in
+                {cases}
+                *) echo "Error: unexpected $target" >&2; exit 1;;
+                esac
+                """
+            ).format(cases=dedent(cases))
+        )
+        path.chmod(0o755)
+        return LXC(lxc_path=path)
+
+    return make
+
+
+def test_list_instance(fake_lxc):
+    lxc = fake_lxc(
+        """\
+        "local:/1.0/instances/t1?project=p") echo '{"name": "t1"}';;
+        """
+    )
+
+    assert lxc.list(instance="t1", project="p") == [dict(name="t1")]
+
+
+def test_list_instance_missing(fake_lxc):
+    lxc = fake_lxc(
+        """\
+        "local:/1.0/instances/t1?project=p") echo "Error: not found" >&2; exit 1;;
+        "local:/1.0/instances?project=p") echo '["/1.0/instances/t10?project=p"]';;
+        """
+    )
+
+    assert lxc.list(instance="t1", project="p") == []
+
+
+def test_list_instance_error(fake_lxc):
+    lxc = fake_lxc(
+        """\
+        "local:/1.0/instances/t1?project=p") echo "Error: failed" >&2; exit 1;;
+        "local:/1.0/instances?project=p") echo '["/1.0/instances/t1?project=p"]';;
+        """
+    )
+
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        lxc.list(instance="t1", project="p")
+
+    assert raised.value.stderr == b"Error: failed\n"
+
+
+def test_list_instance_project_missing(fake_lxc):
+    lxc = fake_lxc(
+        """\
+        "local:/1.0/instances/t1?project=p") echo "Error: not found" >&2; exit 1;;
+        "local:/1.0/instances?project=p") echo "Error: not found" >&2; exit 1;;
+        """
+    )
+
+    with pytest.raises(subprocess.CalledProcessError):
+        lxc.list(instance="t1", project="p")
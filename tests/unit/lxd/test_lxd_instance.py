@@ -0,0 +1,26 @@
+import pathlib
+from unittest import mock
+
+import pytest
+
+from craft_providers.lxd import LXC, LXDInstance
+
+
+@pytest.fixture
+def mock_run():
+    with mock.patch(
+        "craft_providers.util.path.which_required",
+        return_value=pathlib.Path("/usr/bin/rsync"),
+    ), mock.patch("subprocess.run") as run:
+        yield run
+
+
+def test_rsync_destination_with_space(mock_run):
+    instance = LXDInstance(name="t1", lxc=LXC(lxc_path=pathlib.Path("/bin/lxc")))
+
+    instance._rsync(source="/src", destination="t1:/root/my project")
+
+    command = mock_run.call_args[0][0]
+    assert "--protect-args" in command
+    assert command[-2:] == ["/src/", "t1:/root/my project/"]
+    assert mock_run.call_args[1] == dict(check=True)
@@ -0,0 +1,167 @@
+import subprocess
+
+import pytest
+
+from craft_providers.lxd.shell_session import ShellSession
+
+
+class _Spawner:
+    """Spawn a local sh, standing in for `lxc exec -- sh`."""
+
+    def __init__(self, command=None):
+        self.command = command or ["sh"]
+        self.procs = []
+
+    def __call__(self):
+        proc = subprocess.Popen(
+            self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self.procs.append(proc)
+        return proc
+
+
+class _InterruptingReader:
+    """Wrap a pipe, raising KeyboardInterrupt on the first readline()."""
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.interrupted = False
+
+    def readline(self):
+        if not self.interrupted:
+            self.interrupted = True
+            raise KeyboardInterrupt()
+        return self.pipe.readline()
+
+    def close(self):
+        self.pipe.close()
+
+
+@pytest.fixture
+def spawner():
+    return _Spawner()
+
+
+@pytest.fixture
+def session(spawner):
+    session = ShellSession(spawn=spawner)
+    yield session
+    session.close()
+
+
+@pytest.mark.parametrize(
+    "command,expected",
+    [
+        (["printf", "abc"], b"abc"),
+        (["printf", "abc\n"], b"abc\n"),
+        (["printf", "a\n\nb\n\n"], b"a\n\nb\n\n"),
+        (["true"], b""),
+        (["echo", "quoted 'arg' $HOME"], b"quoted 'arg' $HOME\n"),
+    ],
+)
+def test_run_captures_output(session, command, expected):
+    proc = session.run(command, stdout=subprocess.PIPE)
+
+    assert proc.returncode == 0
+    assert proc.stdout == expected
+
+
+def test_run_returncode(session):
+    proc = session.run(["sh", "-c", "exit 3"], stdout=subprocess.PIPE)
+
+    assert proc.returncode == 3
+
+
+def test_run_check_raises(session):
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        session.run(["sh", "-c", "echo out; exit 2"], check=True)
+
+    assert raised.value.returncode == 2
+    assert raised.value.output == b"out\n"
+
+
+def test_run_discards_stdout(session):
+    proc = session.run(["echo", "discarded"], stdout=subprocess.DEVNULL)
+
+    assert proc.returncode == 0
+    assert proc.stdout is None
+
+
+def test_run_merges_stderr(session):
+    proc = session.run(
+        ["sh", "-c", "echo out; echo err >&2"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+
+    assert proc.stdout == b"out\nerr\n"
+
+
+def test_run_does_not_consume_session_input(session):
+    assert session.run(["cat"]).stdout == b""
+    assert session.run(["echo", "next"]).stdout == b"next\n"
+
+
+def test_run_does_not_alter_session_state(session):
+    session.run(["sh", "-c", "exit 1"])
+    session.run(["cd", "/"])
+
+    assert session.run(["echo", "still running"]).stdout == b"still running\n"
+
+
+def test_run_reuses_shell(session, spawner):
+    for _ in range(3):
+        session.run(["true"])
+
+    assert len(spawner.procs) == 1
+
+
+def test_run_interrupted_discards_shell(session, spawner):
+    session.run(["true"])
+    proc = spawner.procs[0]
+    proc.stdout = _InterruptingReader(proc.stdout)
+
+    with pytest.raises(KeyboardInterrupt):
+        session.run(["sh", "-c", "echo stale; exit 7"])
+
+    assert proc.poll() is not None
+
+    # The interrupted command's output and exit code must not leak into the
+    # next command's result.
+    result = session.run(["echo", "fresh"])
+
+    assert len(spawner.procs) == 2
+    assert result.returncode == 0
+    assert result.stdout == b"fresh\n"
+
+
+def test_run_shell_terminated():
+    spawner = _Spawner(["sh", "-c", "read line; exit 0"])
+    session = ShellSession(spawn=spawner)
+
+    with pytest.raises(RuntimeError):
+        session.run(["true"])
+
+    spawner.command = ["sh"]
+
+    assert session.run(["true"]).returncode == 0
+    assert len(spawner.procs) == 2
+
+    session.close()
+
+
+@pytest.mark.parametrize(
+    "kwargs,supported",
+    [
+        (dict(stdout=subprocess.PIPE), True),
+        (dict(stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), True),
+        (dict(stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True), True),
+        (dict(), False),
+        (dict(stdout=None), False),
+        (dict(stdout=subprocess.PIPE, stderr=subprocess.PIPE), False),
+        (dict(stdout=subprocess.PIPE, input=b""), False),
+        (dict(stdout=subprocess.PIPE, timeout=1), False),
+    ],
+)
+def test_supports(kwargs, supported):
+    assert ShellSession.supports(kwargs) is supported